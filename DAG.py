@@ -1,4 +1,9 @@
 from DAGNode import DAGNode
+from FrozenDAG import FrozenDAG
+from Point import Point
+from LineSegment import LineSegment
+from contextlib import contextmanager
+import json
 import pprint as pp
 
 
@@ -13,11 +18,200 @@ class DAG:
         self.root = root
 
     def in_order(self, node):
-        if node:
-            yield from self.in_order(node.left_child)
+        """
+        The nodes below node in symmetric order. Subtrees are shared, so every
+        node is only visited the first time it is reached.
+        """
+        visited = set()
+        stack = []
+        while stack or node is not None:
+            if node is not None and node not in visited:
+                visited.add(node)
+                stack.append(node)
+                node = node.left_child
+            elif stack:
+                node = stack.pop()
+                yield node
+                node = node.right_child
+            else:
+                node = None
+
+    def nodes(self):
+        """
+        Every node once, in depth-first order from the root, parents before their children
+        """
+        visited = {self.root}
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
             yield node
-            yield from self.in_order(node.right_child)
+            for child in (node.right_child, node.left_child):
+                if child is not None and child not in visited:
+                    visited.add(child)
+                    stack.append(child)
+
+    def stats(self) -> dict:
+        """
+        Size and shape of the search structure, every node is counted once
+        :return: dict with the number of nodes, X-nodes, Y-nodes, leaves and edges,
+            the depth (inner nodes on the longest search path) and the largest and
+            mean fan-in (number of parents) of the nodes below the root
+        """
+        x_nodes = y_nodes = leaves = edges = 0
+        fan_in = {}
+        for node in self.nodes():
+            if node.left_child is None:
+                leaves += 1
+                continue
+            if isinstance(node.graph_object, Point):
+                x_nodes += 1
+            else:
+                y_nodes += 1
+            for child in (node.left_child, node.right_child):
+                edges += 1
+                fan_in[child] = fan_in.get(child, 0) + 1
+        return {'nodes': x_nodes + y_nodes + leaves, 'x_nodes': x_nodes, 'y_nodes': y_nodes, 'leaves': leaves,
+                'edges': edges, 'depth': self.depth(), 'max_fan_in': max(fan_in.values(), default=0),
+                'mean_fan_in': edges / len(fan_in) if fan_in else 0.0}
+
+    def depth(self) -> int:
+        """
+        Length of the longest search path, i.e. the number of inner nodes
+        on the longest path from the root to a leaf
+        :return:
+        """
+        height = {}
+        stack = [self.root]
+        while stack:
+            node = stack[-1]
+            if node.left_child is None:
+                height[node] = 0
+                stack.pop()
+                continue
+            pending = [c for c in (node.left_child, node.right_child) if c not in height]
+            if pending:
+                stack.extend(pending)
+            else:
+                height[node] = 1 + max(height[node.left_child], height[node.right_child])
+                stack.pop()
+        return height[self.root]
+
+    def write_dot(self, file):
+        """
+        Stream the search structure to a Graphviz DOT file, one line per node and
+        edge, without building the graph in memory first
+        :param file: path or text file object
+        :return:
+        """
+        with output(file) as out:
+            out.write('digraph DAG {\n')
+            for i, node, left, right in self.numbered():
+                out.write('  n%d [shape=%s, label="%s"];\n' % (i, *dot_label(node.graph_object)))
+                if left is not None:
+                    out.write('  n%d -> n%d [label="L"];\n  n%d -> n%d [label="R"];\n' % (i, left, i, right))
+            out.write('}\n')
+
+    def write_json(self, file):
+        """
+        Stream the search structure to a JSON file {"root": 0, "nodes": [...]}, where
+        every node lists its kind, its geometry and the ids of its children
+        :param file: path or text file object
+        :return:
+        """
+        with output(file) as out:
+            out.write('{"root": 0, "nodes": [')
+            for i, node, left, right in self.numbered():
+                record = {'id': i}
+                record.update(json_fields(node.graph_object))
+                if left is not None:
+                    record['left'], record['right'] = left, right
+                out.write((',\n' if i else '\n') + json.dumps(record))
+            out.write('\n]}\n')
+
+    def numbered(self):
+        """
+        Every node once with consecutive ids, the root is 0
+        :return: iterator over (id, node, left child id, right child id), the child ids are None for leaves
+        """
+        ids = {}
+        for node in self.nodes():
+            i = ids.setdefault(node, len(ids))
+            if node.left_child is None:
+                yield i, node, None, None
+            else:
+                left = ids.setdefault(node.left_child, len(ids))
+                right = ids.setdefault(node.right_child, len(ids))
+                yield i, node, left, right
+
+    def locate(self, x, y, stats=None) -> DAGNode:
+        """
+        Locate an arbitrary query point. Points on a segment count as above it
+        and points on a vertical line through an X-node count as right of it if
+        they lie above the point, like in FrozenDAG.locate.
+        :param x:
+        :param y:
+        :param stats: optional Instrumentation that counts the visited nodes
+        :return: the leaf of the trapezoid containing (x, y)
+        """
+        node = self.root
+        while node.left_child is not None:
+            if stats is not None:
+                stats.nodes_visited += 1
+            obj = node.graph_object
+            if isinstance(obj, Point):
+                go_right = x > obj.x or (x == obj.x and y > obj.y)
+            else:
+                go_right = obj.side_of(x, y) >= 0
+            node = node.right_child if go_right else node.left_child
+        return node
+
+    def freeze(self) -> FrozenDAG:
+        """
+        Flatten the search structure into arrays for batch point location
+        :return: FrozenDAG
+        """
+        return FrozenDAG.from_root(self.root)
 
     def __repr__(self):
         return '<DAG>\n\t' + pp.pformat(list(self.in_order(self.root)), indent=4) + '\n</DAG>'
         # return '<DAG: \n%s>' % '\n\n'.join(str(n) for n in list(self.in_order(self.root)))
+
+
+@contextmanager
+def output(file):
+    """
+    Write to a path or to an open text file, which is left open
+    """
+    if isinstance(file, str):
+        with open(file, 'w') as out:
+            yield out
+    else:
+        yield file
+
+
+def point_json(p) -> list:
+    return [p.x, p.y]
+
+
+def segment_json(s) -> list:
+    return [s.p.x, s.p.y, s.q.x, s.q.y]
+
+
+def json_fields(obj) -> dict:
+    if isinstance(obj, Point):
+        return {'kind': 'x', 'point': point_json(obj)}
+    if isinstance(obj, LineSegment):
+        return {'kind': 'y', 'segment': segment_json(obj)}
+    return {'kind': 'leaf', 'left_p': point_json(obj.left_p), 'right_p': point_json(obj.right_p),
+            'top': segment_json(obj.top), 'bottom': segment_json(obj.bottom)}
+
+
+def dot_label(obj) -> tuple:
+    """
+    Shape and label of a node in a DOT file
+    """
+    if isinstance(obj, Point):
+        return 'ellipse', 'x %s' % obj
+    if isinstance(obj, LineSegment):
+        return 'box', 'y %s %s' % (obj.p, obj.q)
+    return 'plaintext', 'T %s %s' % (obj.left_p, obj.right_p)
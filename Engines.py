@@ -0,0 +1,49 @@
+"""
+The decomposition engines by name, and the time limit on builds, shared by the
+benchmark and batch scripts.
+"""
+import contextlib
+import signal
+
+from RandomizedIncrementalConstruction import RandomizedIncrementalConstruction
+from LineSweep import LineSweep
+
+ENGINES = {
+    'ric': RandomizedIncrementalConstruction,
+    'sweep': LineSweep,
+}
+
+
+def build(engine, polygon, seed=0):
+    """
+    Decompose a polygon with one of the ENGINES
+    :param engine: name of the engine
+    :param polygon: Polygon to decompose
+    :param seed: seed of the insertion order of the randomized construction, the sweep is deterministic
+    :return: the construction
+    """
+    if engine == 'ric':
+        return RandomizedIncrementalConstruction(polygon, seed=seed)
+    return ENGINES[engine](polygon)
+
+
+class Timeout(Exception):
+    pass
+
+
+def on_alarm(signum, frame):
+    raise Timeout()
+
+
+@contextlib.contextmanager
+def time_limit(seconds):
+    """
+    Raise Timeout in the block once it has run for the given number of seconds
+    :param seconds: 0 for no limit
+    """
+    signal.signal(signal.SIGALRM, on_alarm)
+    signal.alarm(seconds)
+    try:
+        yield
+    finally:
+        signal.alarm(0)
@@ -0,0 +1,343 @@
+import mmap
+import struct
+from collections.abc import Sequence
+
+import numpy as np
+
+from DAGNode import DAGNode
+from Point import Point
+from LineSegment import LineSegment
+from Trapezoid import BaseTrapezoid, FrozenTrapezoid
+from Predicates import ORIENTATION_BOUND, exact, sign
+
+# fixed-width records, shared by the in-memory arrays and the file format
+NODE_DTYPE = np.dtype({'names': ['kind', 'left', 'right', 'leaf', 'key_x', 'key_y', 'dx', 'dy'],
+                       'formats': ['u1', '<i4', '<i4', '<i4', '<f8', '<f8', '<f8', '<f8'],
+                       'offsets': [0, 4, 8, 12, 16, 24, 32, 40], 'itemsize': 48})
+TRAPEZOID_DTYPE = np.dtype([('left_x', '<f8'), ('left_y', '<f8'), ('right_x', '<f8'), ('right_y', '<f8'),
+                            ('top', '<i4'), ('bottom', '<i4')])
+SEGMENT_DTYPE = np.dtype([('px', '<f8'), ('py', '<f8'), ('qx', '<f8'), ('qy', '<f8')])
+
+# header: magic, version, node/trapezoid/segment counts and section offsets
+MAGIC = b'VDAG'
+VERSION = 1
+HEADER = struct.Struct('<4sI6Q')
+
+
+class FrozenDAG:
+    """
+    Read-only, flattened copy of a DAG search structure for batch point location.
+
+    Every DAG node becomes a fixed-width record with the node type, the
+    x-key of X-nodes, the segment coefficients of Y-nodes and the indices of
+    the left and right children. Leaves store the id of their trapezoid,
+    which is an index into `trapezoids` and `trapezoid_records`.
+    """
+
+    LEAF = 0
+    X_NODE = 1
+    Y_NODE = 2
+
+    def __init__(self, nodes, trapezoid_records, segment_records, trapezoids=None, buffer=None):
+        """
+        :param nodes: array of NODE_DTYPE records, the root is node 0
+        :param trapezoid_records: array of TRAPEZOID_DTYPE records
+        :param segment_records: array of SEGMENT_DTYPE records
+        :param trapezoids: the trapezoid objects by id, if they exist
+        :param buffer: the mmap backing the arrays, if any
+        """
+        assert nodes.dtype == NODE_DTYPE and trapezoid_records.dtype == TRAPEZOID_DTYPE \
+            and segment_records.dtype == SEGMENT_DTYPE
+        self.bind(nodes, trapezoid_records, segment_records)
+        self.trapezoids = trapezoids if trapezoids is not None else TrapezoidRecords(self)
+        self.buffer = buffer
+
+    def bind(self, nodes, trapezoid_records, segment_records):
+        """
+        Use the given record arrays and the columns of the node records
+        :param nodes:
+        :param trapezoid_records:
+        :param segment_records:
+        :return:
+        """
+        self.nodes = nodes
+        self.trapezoid_records = trapezoid_records
+        self.segment_records = segment_records
+        self.kind = nodes['kind']
+        self.left = nodes['left']
+        self.right = nodes['right']
+        self.leaf = nodes['leaf']
+        # X-nodes use key_x/key_y, Y-nodes use (px, py) and the direction (dx, dy)
+        self.key_x = nodes['key_x']
+        self.key_y = nodes['key_y']
+        self.dx = nodes['dx']
+        self.dy = nodes['dy']
+
+    @classmethod
+    def from_root(cls, root):
+        """
+        Flatten the DAG below root
+        :param root: DAGNode
+        :return: FrozenDAG
+        """
+        assert isinstance(root, DAGNode)
+        trapezoids = []
+        # a trapezoid can have several leaves, see RandomizedIncrementalConstruction.reuseLeaves
+        trapezoid_ids = {}
+        segment_ids = {}
+
+        order = [root]
+        index = {id(root): 0}
+        stack = [root]
+        # iterative traversal that visits every shared node only once
+        while stack:
+            node = stack.pop()
+            if node.left_child is None:
+                continue
+            for child in (node.left_child, node.right_child):
+                if id(child) not in index:
+                    index[id(child)] = len(order)
+                    order.append(child)
+                    stack.append(child)
+
+        n = len(order)
+        kind, leaf = [cls.LEAF] * n, [-1] * n
+        left, right = [-1] * n, [-1] * n
+        key_x, key_y, dx, dy = [0.0] * n, [0.0] * n, [0.0] * n, [0.0] * n
+        for i, node in enumerate(order):
+            obj = node.graph_object
+            if isinstance(obj, BaseTrapezoid):
+                leaf[i] = trapezoid_ids.setdefault(obj, len(trapezoids))
+                if leaf[i] == len(trapezoids):
+                    trapezoids.append(obj)
+                continue
+            if isinstance(obj, Point):
+                kind[i] = cls.X_NODE
+                key_x[i], key_y[i] = obj.x, obj.y
+            elif isinstance(obj, LineSegment):
+                kind[i] = cls.Y_NODE
+                key_x[i], key_y[i] = obj.p.x, obj.p.y
+                dx[i], dy[i] = obj.q.x - obj.p.x, obj.q.y - obj.p.y
+            else:
+                raise ValueError('invalid DAG node!')
+            left[i], right[i] = index[id(node.left_child)], index[id(node.right_child)]
+
+        nodes = np.zeros(n, dtype=NODE_DTYPE)
+        for name, column in (('kind', kind), ('left', left), ('right', right), ('leaf', leaf),
+                             ('key_x', key_x), ('key_y', key_y), ('dx', dx), ('dy', dy)):
+            nodes[name] = column
+
+        trapezoid_records = np.array([(t.left_p.x, t.left_p.y, t.right_p.x, t.right_p.y,
+                                       segment_ids.setdefault(t.top, len(segment_ids)),
+                                       segment_ids.setdefault(t.bottom, len(segment_ids)))
+                                      for t in trapezoids], dtype=TRAPEZOID_DTYPE)
+        segment_records = np.array([(s.p.x, s.p.y, s.q.x, s.q.y) for s in segment_ids], dtype=SEGMENT_DTYPE)
+
+        return cls(nodes, trapezoid_records, segment_records, trapezoids)
+
+    def save(self, path):
+        """
+        Write the search structure, the trapezoids and their segments to a
+        single versioned binary file of fixed-width records
+        :param path:
+        :return:
+        """
+        sections = [self.nodes, self.trapezoid_records, self.segment_records]
+        offsets = []
+        offset = HEADER.size
+        for section in sections:
+            # keep every section 8-byte aligned
+            offset += -offset % 8
+            offsets.append(offset)
+            offset += section.nbytes
+
+        with open(path, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, len(self.nodes), len(self.trapezoid_records),
+                                   len(self.segment_records), *offsets))
+            for section, offset in zip(sections, offsets):
+                file.write(b'\0' * (offset - file.tell()))
+                file.write(np.ascontiguousarray(section).tobytes())
+
+    @classmethod
+    def load(cls, path):
+        """
+        Memory-map a file written by save. Nothing is deserialized: the
+        arrays are views on the mapped pages, which are shared by every
+        process that opens the same file.
+        :param path:
+        :return: FrozenDAG
+        """
+        with open(path, 'rb') as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(buffer) < HEADER.size:
+            raise ValueError('%s is not a decomposition file' % path)
+        magic, version = HEADER.unpack_from(buffer)[:2]
+        if magic != MAGIC:
+            raise ValueError('%s is not a decomposition file' % path)
+        if version != VERSION:
+            raise ValueError('Unsupported decomposition file version %d (expected %d)' % (version, VERSION))
+
+        return cls(*map_records(buffer), buffer=buffer)
+
+    def __len__(self):
+        return len(self.kind)
+
+    def nbytes(self) -> int:
+        """
+        Size in bytes of the node, trapezoid and segment records
+        :return:
+        """
+        return self.nodes.nbytes + self.trapezoid_records.nbytes + self.segment_records.nbytes
+
+    def depth(self) -> int:
+        """
+        Length of the longest search path, i.e. the number of inner nodes
+        on the longest path from the root to a leaf
+        :return:
+        """
+        kind, left, right = self.kind.tolist(), self.left.tolist(), self.right.tolist()
+        height = [-1] * len(kind)
+        stack = [0]
+        while stack:
+            i = stack[-1]
+            if kind[i] == self.LEAF:
+                height[i] = 0
+                stack.pop()
+                continue
+            pending = [c for c in (left[i], right[i]) if height[c] < 0]
+            if pending:
+                stack.extend(pending)
+            else:
+                height[i] = 1 + max(height[left[i]], height[right[i]])
+                stack.pop()
+        return height[0]
+
+    def side(self, i, x, y) -> int:
+        """
+        Exact position of (x, y) relative to the segment of Y-node i
+        :return: 1 if the point lies above the segment, -1 if it lies below and 0 if it lies on it
+        """
+        kx, ky, dx, dy = float(self.key_x[i]), float(self.key_y[i]), float(self.dx[i]), float(self.dy[i])
+        x, y = float(x), float(y)
+        left = dx * (y - ky)
+        right = dy * (x - kx)
+        det = left - right
+        if abs(det) > ORIENTATION_BOUND * (abs(left) + abs(right)):
+            return sign(det)
+        kx, ky, dx, dy, x, y = map(exact, (kx, ky, dx, dy, x, y))
+        return sign(dx * (y - ky) - dy * (x - kx))
+
+    def locate(self, x, y) -> int:
+        """
+        Locate a single point
+        :param x:
+        :param y:
+        :return: id of the trapezoid containing (x, y)
+        """
+        i = 0
+        kind = self.kind
+        while kind[i] != self.LEAF:
+            if kind[i] == self.X_NODE:
+                go_right = x > self.key_x[i] or (x == self.key_x[i] and y > self.key_y[i])
+            else:
+                # points on the segment count as above it, like LineSegment.aboveLine
+                go_right = self.side(i, x, y) >= 0
+            i = self.right[i] if go_right else self.left[i]
+        return int(self.leaf[i])
+
+    def locate_many(self, xs, ys) -> np.ndarray:
+        """
+        Locate many points at once. All points descend the DAG together,
+        one level per iteration, so the Python overhead is per level and not
+        per point.
+        :param xs: x-coordinates of the query points
+        :param ys: y-coordinates of the query points
+        :return: array with the id of the containing trapezoid of every point
+        """
+        xs = np.asarray(xs, dtype=np.float64).ravel()
+        ys = np.asarray(ys, dtype=np.float64).ravel()
+        assert xs.shape == ys.shape, 'xs and ys must have the same length'
+
+        node = np.zeros(len(xs), dtype=np.int32)
+        active = np.flatnonzero(self.kind[node] != self.LEAF)
+        while len(active):
+            i = node[active]
+            x, y = xs[active], ys[active]
+            kx, ky = self.key_x[i], self.key_y[i]
+            is_x = self.kind[i] == self.X_NODE
+            right_of_x = (x > kx) | ((x == kx) & (y > ky))
+            left = self.dx[i] * (y - ky)
+            right = self.dy[i] * (x - kx)
+            det = left - right
+            above_y = det >= 0
+            # points too close to a segment for the float filter are decided exactly
+            for j in np.flatnonzero(~is_x & (np.abs(det) <= ORIENTATION_BOUND * (np.abs(left) + np.abs(right)))):
+                above_y[j] = self.side(i[j], x[j], y[j]) >= 0
+            go_right = np.where(is_x, right_of_x, above_y)
+
+            i = np.where(go_right, self.right[i], self.left[i])
+            node[active] = i
+            active = active[self.kind[i] != self.LEAF]
+
+        return self.leaf[node]
+
+    def close(self):
+        """
+        Release the memory map of a loaded file. While arrays taken from the
+        FrozenDAG are still referenced the map cannot be released: BufferError
+        is raised and the FrozenDAG stays usable.
+        """
+        if self.buffer is None:
+            return
+        # the arrays are views on the mmap, which cannot be closed while they exist
+        self.kind = self.left = self.right = self.leaf = None
+        self.key_x = self.key_y = self.dx = self.dy = None
+        self.nodes = self.trapezoid_records = self.segment_records = None
+        try:
+            self.buffer.close()
+        except BufferError:
+            # arrays of the FrozenDAG are still used elsewhere, so it stays open
+            self.bind(*map_records(self.buffer))
+            raise BufferError('cannot close a FrozenDAG whose arrays are still in use')
+        self.buffer = None
+
+    def __repr__(self):
+        return '<FrozenDAG nodes:%d trapezoids:%d>' % (len(self.kind), len(self.trapezoid_records))
+
+
+def map_records(buffer):
+    """
+    The record arrays in a buffer written by FrozenDAG.save, as views on the buffer
+    :param buffer:
+    :return: nodes, trapezoid records, segment records
+    """
+    n_nodes, n_trapezoids, n_segments, *offsets = HEADER.unpack_from(buffer)[2:]
+    return (np.frombuffer(buffer, dtype=NODE_DTYPE, count=n_nodes, offset=offsets[0]),
+            np.frombuffer(buffer, dtype=TRAPEZOID_DTYPE, count=n_trapezoids, offset=offsets[1]),
+            np.frombuffer(buffer, dtype=SEGMENT_DTYPE, count=n_segments, offset=offsets[2]))
+
+
+class TrapezoidRecords(Sequence):
+    """
+    Trapezoids of a loaded FrozenDAG. The FrozenTrapezoid objects are only
+    built from the records when they are accessed, and are kept afterwards.
+    """
+
+    def __init__(self, frozen):
+        self.frozen = frozen
+        self.built = [None] * len(frozen.trapezoid_records)
+
+    def segment(self, i) -> LineSegment:
+        px, py, qx, qy = self.frozen.segment_records[i].tolist()
+        return LineSegment(Point(px, py), Point(qx, qy))
+
+    def __getitem__(self, i):
+        t = self.built[i]
+        if t is None:
+            left_x, left_y, right_x, right_y, top, bottom = self.frozen.trapezoid_records[i].tolist()
+            t = self.built[i] = FrozenTrapezoid(Point(left_x, left_y), Point(right_x, right_y),
+                                                self.segment(top), self.segment(bottom), i)
+        return t
+
+    def __len__(self):
+        return len(self.frozen.trapezoid_records)
@@ -1,8 +1,10 @@
 class GraphObject:
+    __slots__ = ()
+
     def __init__(self):
         pass
 
-    def __hash__(self):
-        """Override the default hash behavior (that returns the id or the object)"""
-        # return hash(tuple(sorted(self.__dict__.items())))
-        return hash(str(self))
+    # Objects in the map and the search structure (trapezoids, DAG nodes) are
+    # identified by identity. Geometric types override this with a hash of
+    # their coordinates, so no strings are built for set and dict operations.
+    __hash__ = object.__hash__
@@ -0,0 +1,67 @@
+import time
+
+
+class Instrumentation:
+    """
+    Opt-in counters and timing hooks for a RandomizedIncrementalConstruction
+    build. Pass an instance to the construction to enable them; without one
+    the hot paths only test for None.
+
+    Counters:
+        segments_inserted   line segments inserted, vertical ones included
+        nodes_visited       DAG nodes visited while locating segment endpoints
+        trapezoids_walked   trapezoids visited by the walk along inserted segments
+        trapezoids_created  trapezoids allocated
+        trapezoids_merged   parts of walked trapezoids that were merged into their left neighbor's part
+        trapezoids_deleted  trapezoids removed from the map
+    """
+
+    COUNTERS = ('segments_inserted', 'nodes_visited', 'trapezoids_walked', 'trapezoids_created',
+                'trapezoids_merged', 'trapezoids_deleted')
+
+    def __init__(self, on_insert=None, trace=None):
+        """
+        :param on_insert: called as on_insert(line_seg, seconds, instrumentation) after every insertion
+        :param trace: called with a debug message for every inserted segment, e.g. print
+        """
+        assert on_insert is None or callable(on_insert)
+        assert trace is None or callable(trace)
+        self.on_insert = on_insert
+        self.trace = trace
+        self.reset()
+
+    def reset(self):
+        """
+        Zero all counters and forget the insert times
+        """
+        for counter in self.COUNTERS:
+            setattr(self, counter, 0)
+        self.insert_times = []
+
+    def time_insert(self, insert, line_seg):
+        """
+        Run and time a single insertion
+        :param insert: the insertion function
+        :param line_seg: the line segment to insert
+        :return: the result of the insertion
+        """
+        start = time.perf_counter()
+        result = insert(line_seg)
+        seconds = time.perf_counter() - start
+        self.segments_inserted += 1
+        self.insert_times.append(seconds)
+        if self.on_insert is not None:
+            self.on_insert(line_seg, seconds, self)
+        return result
+
+    def as_dict(self) -> dict:
+        """
+        The counters and the total insert time
+        :return:
+        """
+        result = {counter: getattr(self, counter) for counter in self.COUNTERS}
+        result['insert_s'] = sum(self.insert_times)
+        return result
+
+    def __repr__(self):
+        return '<Instrumentation %s>' % ' '.join('%s:%d' % (c, getattr(self, c)) for c in self.COUNTERS)
@@ -1,50 +1,81 @@
-import math
 from Point import Point
 from GraphObject import GraphObject
+from Predicates import orientation, compare_heights
+
+_setattr = object.__setattr__
 
 
 class LineSegment(GraphObject):
     """
-    Class to represent a line segment with 2 endpoints
+    Class to represent an immutable line segment with 2 endpoints. The slope,
+    intercept and squared length are computed once at construction.
     """
 
+    __slots__ = ('p', 'q', 'isVertical', 'slope', 'intercept', 'len', '_hash')
+
     def __init__(self, p, q):
-        super().__init__()
         assert isinstance(p, Point) and isinstance(q, Point)
         # we want to make sure p is always the left point
-        if p.x < q.x:
-            self.p = p
-            self.q = q
-        elif p.x > q.x:
-            self.p = q
-            self.q = p
-        else:
-            if p.y < q.y:
-                self.p = p
-                self.q = q
-            else:
-                self.p = q
-                self.q = p
-
-        if p.x == q.x:
-            self.isVertical = True
+        if p.x > q.x or (p.x == q.x and p.y >= q.y):
+            p, q = q, p
+        _setattr(self, 'p', p)
+        _setattr(self, 'q', q)
+
+        dx = q.x - p.x
+        dy = q.y - p.y
+        _setattr(self, 'isVertical', dx == 0)
+        if dx == 0:
+            _setattr(self, 'slope', None)
+            _setattr(self, 'intercept', None)
         else:
-            self.isVertical = False
+            slope = dy / dx
+            _setattr(self, 'slope', slope)
+            _setattr(self, 'intercept', p.y - slope * p.x)
+        # squared length
+        _setattr(self, 'len', dx * dx + dy * dy)
+
+        # segments are hashed on their endpoints, which do not change afterwards
+        _setattr(self, '_hash', hash((p.x, p.y, q.x, q.y)))
+
+    def __setattr__(self, key, value):
+        raise AttributeError('LineSegment is immutable')
 
-    @property
-    def len(self):
-        return math.pow(self.q.x - self.p.x, 2) + math.pow(self.q.y - self.p.y, 2)
+    def __reduce__(self):
+        return self.__class__, (self.p, self.q)
 
-    @property
-    def slope(self):
-        return None if self.isVertical else (self.q.y - self.p.y) / (self.q.x - self.p.x)
+    def y_at(self, x):
+        """
+        Evaluate the supporting line of a non-vertical segment at x. Use this for
+        drawing only, compare heights with side_of and compare_at.
+        :param x:
+        :return: y-coordinate
+        """
+        if x == self.q.x:
+            return self.q.y
+        # relative to p, the intercept cancels badly for large coordinates
+        return self.p.y + (x - self.p.x) * self.slope
+
+    def side_of(self, x, y) -> int:
+        """
+        Exact position of the point (x, y) relative to the supporting line of a segment. A vertical
+        segment runs upwards in the symbolically sheared plane, so points left of it lie above it.
+        :return: 1 if the point lies above the line, -1 if it lies below and 0 if it lies on it
+        """
+        p, q = self.p, self.q
+        return orientation(p.x, p.y, q.x, q.y, x, y)
 
-    @property
-    def intercept(self):
-        return self.p.y - self.slope * self.p.x
+    def compare_at(self, other, x) -> int:
+        """
+        Exact comparison of the heights of two non-vertical segments at x
+        :return: 1 if self lies above other at x, -1 if it lies below and 0 if they meet
+        """
+        if self is other:
+            return 0
+        p1, q1, p2, q2 = self.p, self.q, other.p, other.q
+        return compare_heights(p1.x, p1.y, q1.x, q1.y, p2.x, p2.y, q2.x, q2.y, x)
 
     def get_Y(self, x):
-        return Point(x, self.slope * x + self.intercept)
+        return Point(x, self.y_at(x))
 
     @staticmethod
     def on_segment(p, q, r):
@@ -68,14 +99,8 @@ class LineSegment(GraphObject):
         :return:
         """
         assert isinstance(p, Point) and isinstance(q, Point) and isinstance(r, Point)
-        val = (q.y - p.y) * (r.x - q.x) - (q.x - p.x) * (r.y - q.y)
-
-        # collinear
-        if val == 0:
-            return 0
-
-        # -1 for clockwise, 1 for counter-clockwise
-        return -1 if val > 0 else 1
+        # -1 for clockwise, 0 for collinear, 1 for counter-clockwise
+        return orientation(p.x, p.y, q.x, q.y, r.x, r.y)
 
     def aboveLine(self, point) -> bool:
         """
@@ -87,19 +112,8 @@ class LineSegment(GraphObject):
         assert isinstance(point, Point)
         if self.isVertical:
             raise ValueError("Above line is not defined for Vertical segments")
-        v1x = self.q.x - self.p.x  # Vector 1.x
-        v1y = self.q.y - self.p.y  # Vector 1.y
-        v2x = self.q.x - point.x  # Vector 2.x
-        v2y = self.q.y - point.y  # Vector 2.y
-        xp = v1x * v2y - v1y * v2x  # Cross product
-        # when its larger than zero, return false
-        # so we assume that if it lies on the line that it is "above"
-        if xp > 0:
-            # print('Point below line')
-            return False
-        else:
-            # print('Point above line')
-            return True
+        # points on the line are "above" it
+        return orientation(self.p.x, self.p.y, self.q.x, self.q.y, point.x, point.y) >= 0
 
     def intersects(self, other) -> bool:
         """
@@ -120,10 +134,6 @@ class LineSegment(GraphObject):
         o3 = self.ccw(other.p, other.q, self.p)
         o4 = self.ccw(other.p, other.q, self.q)
 
-        if (self.p == Point(1, 1) and self.q == Point(2, 2)
-            and other.p == Point(2, 2) and other.q == Point(3, 1)):
-            print(o1, o2, o3, o4)
-
         # General case
         if o1 != o2 and o3 != o4:
             return True
@@ -158,12 +168,12 @@ class LineSegment(GraphObject):
         return False
 
     def __hash__(self):
-        return super().__hash__()
+        return self._hash
 
     def __eq__(self, other):
         """Override the default Equals behavior"""
         if isinstance(other, self.__class__):
-            return self.__dict__ == other.__dict__
+            return self is other or (self._hash == other._hash and self.p == other.p and self.q == other.q)
         return NotImplemented
 
     def __ne__(self, other):
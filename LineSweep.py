@@ -1,320 +1,184 @@
 from Polygon import Polygon, Point, LineSegment
 from TrapezoidMap import TrapezoidMap, Trapezoid
-from bintrees import AVLTree
+from SweepStatus import SweepStatus
+from PersistentSlabIndex import PersistentSlabIndex
 
 
 class LineSweep:
+    """
+    Deterministic vertical decomposition by a sweep from left to right over the
+    endpoints of the segments, in lexicographic order.
+
+    Between every two consecutive segments in the status there is one open
+    trapezoid, whose right wall is not known yet. At an event point the open
+    trapezoids of the gaps that the point touches are closed and new ones are
+    opened right of it, which also gives the neighbors of every trapezoid. The
+    changes at every event point are recorded in a PersistentSlabIndex for point
+    location, which takes O(n) space and answers queries in O(log n) time.
+    """
+
     def __init__(self, polygon):
         assert isinstance(polygon, Polygon)
         self.polygon = polygon
         # the event structure
         self.Q = []
         # the status structure
-        self.S = AVLTree()
+        self.S = SweepStatus()
         self.lineSweep()
 
     def getTrapezoidalMap(self) -> TrapezoidMap:
         return self.T
 
-    """
-    Run the line sweep
-    """
+    def getSlabIndex(self):
+        return self.index
+
+    def locate(self, x, y) -> Trapezoid:
+        """
+        Locate a query point
+        :param x:
+        :param y:
+        :return: the trapezoid containing (x, y)
+        """
+        return self.index.locate(x, y)
+
+    def locate_many(self, xs, ys):
+        """
+        Locate a batch of query points in the decomposition
+        :param xs: x-coordinates of the query points
+        :param ys: y-coordinates of the query points
+        :return: numpy array of trapezoid ids, indices into getSlabIndex().trapezoids
+        """
+        return self.index.locate_many(xs, ys)
+
+    def locate_region(self, x, y):
+        """
+        Locate the region of a polygon or polygon set that contains a point
+        :return: region label, None if the point lies outside every region
+        """
+        return self.polygon.region_of(self.index.locate(x, y))
+
+    def locate_regions(self, xs, ys) -> list:
+        """
+        Locate the regions of a batch of query points
+        :return: list of region labels, None for points outside every region
+        """
+        labels = [self.polygon.region_of(t) for t in self.index.trapezoids]
+        return [labels[i] for i in self.index.locate_many(xs, ys).tolist()]
 
     def lineSweep(self):
-        self.T = TrapezoidMap([])
-
-        # keeps track of edges that should be removed from S later on
-        self.clearBuffer = False
-        self.buffer = []
+        """
+        Run the line sweep
+        """
+        self.T = TrapezoidMap(set())
+        # the open trapezoid above every segment in the status
+        self.open = {}
 
         # first initialize the event structure
         self.initEventStructure()
-        # now compute the bounding box
+        # now compute the bounding box, which is the first open trapezoid
         self.computeBoundingBox()
-        # now loop over the event points
-        for event in self.Q:
-            self.handleEventPoint(event)
-            # check if the buffer needs to be cleared
-            if (self.clearBuffer):
-                self.emptyBuffer()
-
-        # now just add the last trapezoid
-        self.T.addTrapezoid([Trapezoid(self.Q[-3][0], self.Q[-1][0], self.Q[-1][2], self.Q[-2][2])])
-
-    def handleEventPoint(self, event):
-        # if the event contains a point on the bounding box
-        if event[1] == "G":
-            if event[0] == event[2].p:
-                self.handleStartPoint(event[0], event[2], event[1])
-            else:
-                self.handleEndPoint(event[0], event[2], event[1])
 
+        # now loop over the event points, and index the trapezoids of every slab
+        self.index = PersistentSlabIndex(self.open[self.bottomEdge])
+        for point, ending, starting in self.Q:
+            closed, opened = self.handleEventPoint(point, ending, starting)
+            self.index.update(point, closed, opened)
+
+        # now just close the last trapezoid at the top right corner of the bounding box
+        self.closeTrapezoid(self.bottomEdge, self.topRight)
+
+    def handleEventPoint(self, point, ending, starting):
+        """
+        Close the open trapezoids of the gaps that the point touches, replace the
+        segments that end in the point by the ones that start in it and open the
+        trapezoids of the new gaps
+        :param point: event point
+        :param ending: the segments that end in the point
+        :param starting: the segments that start in the point
+        :return: (closed, opened), the trapezoids left and right of the point from bottom to top
+        """
+        if ending:
+            # the ending segments are consecutive in the status
+            ends = set(ending)
+            segment = next(s for s in ending if self.S.pred(s) not in ends)
+            below = self.S.pred(segment)
+            closed = [below]
+            while segment in ends:
+                closed.append(segment)
+                segment = self.S.succ(segment)
+            above = segment
+            for segment in ending:
+                self.S.remove(segment)
         else:
-            if event[0] == event[2].p:
-                self.handleStartPoint(event[0], event[2], event[1], event[3])
-            elif event[0] == event[2].q:
-                self.handleEndPoint(event[0], event[2], event[1], event[3])
-            else:
-                raise ValueError("point is not part of the linesegment")
-
-            if event[0] == event[3].p:
-                self.handleStartPoint(event[0], event[3], event[1], event[2])
-            elif event[0] == event[3].q:
-                self.handleEndPoint(event[0], event[3], event[1], event[2])
-            else:
-                raise ValueError("point is not part of the linesegment")
-
-    # removes all edges from the status that are in the buffer
-    def emptyBuffer(self):
-        for edge in self.buffer:
-            self.S.remove(edge)
-
-        self.buffer.clear()
-        self.clearBuffer = False
-
-    def handleStartPoint(self, point, linesegment, case=None, otherline=None):
-        assert isinstance(point, Point)
-        assert isinstance(linesegment, LineSegment)
-
-        # insert the segment into the status
-        if (not linesegment.isVertical):
-            self.S.insert(linesegment, linesegment)
-
-            pred = self.getPred(linesegment)
-            succ = self.getSucc(linesegment)
-
-            if case == "A":
-                pass
-            elif case == "B":
-                # first check the pred and succ of the current line
-                if pred == otherline:
-                    # get a new predecessor
-                    pred = self.getPred(otherline)
-
-                if succ == otherline:
-                    # get a new successor
-                    succ = self.getSucc(otherline)
-
-                # make trapezoids with pred and/or succ
-                if pred.p.x < succ.p.x:
-                    self.T.addTrapezoid([Trapezoid(succ.p, point, succ, pred)])
+            below, above = self.S.locate(point)
+            closed = [below]
+        closed = [self.closeTrapezoid(bottom, point) for bottom in closed]
+
+        opened = [below]
+        if starting:
+            vertical = None
+            for segment in starting:
+                if segment.isVertical:
+                    vertical = segment
                 else:
-                    self.T.addTrapezoid([Trapezoid(pred.p, point, succ, pred)])
-            elif case == "C":
-                raise ValueError("This should not happen!")
-            elif case == "D":
-                pass
-                # TODO: is this really required?
-            elif case == "E":
-                raise ValueError("This should not happen!")
-            elif case == "F":
-                # we simply ignore this case
-                pass
-            else:
-                # the event point is on the bounding box
-                pass
-
-    def handleEndPoint(self, point, linesegment, case, otherline=None):
-        assert isinstance(point, Point)
-        assert isinstance(linesegment, LineSegment)
-
-        donotremove = False
-
-        if not linesegment.isVertical:
-
-            pred = self.getPred(linesegment)
-            succ = self.getSucc(linesegment)
-
-            if case == "A":
-                # make a trapezoid with the current linesegment
-                if pred.p.x <= linesegment.p.x:
-                    self.T.addTrapezoid([Trapezoid(linesegment.p, linesegment.q, linesegment, pred)])
-                elif pred.p.x > linesegment.p.x and pred.p.x < linesegment.q.x:
-                    self.T.addTrapezoid([Trapezoid(pred.p, linesegment.q, linesegment, pred)])
-                else:
-                    # in this case we do not know bottom so do nothing
-                    pass
-
-                # also consider successor
-                if succ.p.x <= linesegment.p.x:
-                    self.T.addTrapezoid([Trapezoid(linesegment.p, linesegment.q, succ, linesegment)])
-                elif pred.p.x > linesegment.p.x and pred.p.x < linesegment.q.x:
-                    self.T.addTrapezoid([Trapezoid(succ.p, linesegment.q, succ, linesegment)])
-                else:
-                    # in this case we do not know bottom so do nothing
-                    pass
-            elif case == "B":
-                raise ValueError("this should not be possible!")
-            elif case == "C":
-
-                # special case: keep getting predecessors until this does not hold anymore
-                while succ.p.x == point.x:
-                    succ = self.getSucc(succ)
-
-                # special case: keep getting predecessors until this does not hold anymore
-                while pred.p.x == point.x:
-                    pred = self.getPred(pred)
-
-                if (linesegment > otherline):
-                    # the current line is the top line
-                    # make a trapezoid to the left
-                    if succ.p.x <= linesegment.p.x:
-                        self.T.addTrapezoid([Trapezoid(linesegment.p, point, succ, linesegment)])
-                    elif succ.p.x > linesegment.p.x and succ.p.x < linesegment.q.x:
-                        self.T.addTrapezoid([Trapezoid(succ.p, point, succ, linesegment)])
-
-                if (linesegment < otherline):
-                    # the current line is the bottom one
-                    # make a trapezoid to the left
-                    if pred.p.x <= linesegment.p.x:
-                        self.T.addTrapezoid([Trapezoid(linesegment.p, point, linesegment, pred)])
-                    elif pred.p.x > linesegment.p.x and succ.p.x < linesegment.q.x:
-                        self.T.addTrapezoid([Trapezoid(pred.p, point, linesegment, pred)])
-
-            elif case == "D":
-                raise ValueError("This should not happen")
-            elif case == "E":
-                # special case: keep getting predecessors until this does not hold anymore
-                while pred.p.x == point.x:
-                    pred = self.getPred(pred)
-
-                # line segment is the nonvertical one, we check if linesegment is connected to the bottom of the vertical edge
-                if (linesegment.aboveLine(otherline.q) and linesegment.aboveLine(otherline.p)):
-                    self.buffer.append(linesegment)
-                    donotremove = True
-
-                if succ.p.x <= linesegment.p.x:
-                    self.T.addTrapezoid([Trapezoid(linesegment.p, linesegment.q, succ, linesegment)])
-                elif succ.p.x > linesegment.p.x and succ.p.x < linesegment.q.x:
-                    self.T.addTrapezoid([Trapezoid(succ.p, linesegment.q, succ, linesegment)])
-
-                if pred.p.x <= linesegment.p.x:
-                    self.T.addTrapezoid([Trapezoid(linesegment.p, linesegment.q, linesegment, pred)])
-                elif pred.p.x > linesegment.p.x and succ.p.x < linesegment.q.x:
-                    self.T.addTrapezoid([Trapezoid(pred.p, linesegment.q, linesegment, pred)])
-
-            elif case == "F":
-                # we simply ignore this case
-                pass
-            else:
-                # the event point is on the bounding box
-                pass
-
-            # only if there are no edges in the buffer, remove the edge
-            if not donotremove:
-                # remove the linesegment from the status
-                self.S.remove(linesegment)
-
-        elif linesegment.isVertical:
-            # we wish to clear the buffer after this event point
-            self.clearBuffer = True
-
-    def getPred(self, linesegment) -> LineSegment:
-        assert (isinstance(linesegment, LineSegment))
-
-        try:
-            return self.S.prev_key(linesegment)
-        except KeyError:
-            return None
-
-    def getSucc(self, linesegment) -> LineSegment:
-        assert (isinstance(linesegment, LineSegment))
-
-        try:
-            return self.S.succ_key(linesegment)
-        except KeyError:
-            return None
+                    self.S.insert(segment, point.x)
+            if vertical is not None:
+                # the steepest segment that starts in the point
+                self.S.insert_below(vertical, above)
+            segment = self.S.succ(below)
+            while segment is not above:
+                opened.append(segment)
+                segment = self.S.succ(segment)
+        tops = opened[1:] + [above]
+        opened = [self.openTrapezoid(point, top, bottom) for bottom, top in zip(opened, tops)]
+
+        # the top trapezoids on either side share the segment above the point,
+        # the bottom trapezoids share the segment below it
+        opened[-1].upper_left, closed[-1].upper_right = closed[-1], opened[-1]
+        opened[0].lower_left, closed[0].lower_right = closed[0], opened[0]
+        return closed, opened
+
+    def openTrapezoid(self, left_p, top, bottom) -> Trapezoid:
+        """
+        Open the trapezoid between bottom and top right of left_p. Its right wall is set when it is closed.
+        """
+        t = self.T.newTrapezoid(left_p, left_p, top, bottom)
+        self.open[bottom] = t
+        return t
+
+    def closeTrapezoid(self, bottom, right_p) -> Trapezoid:
+        """
+        Close the open trapezoid above bottom at right_p and add it to the map
+        """
+        t = self.open.pop(bottom)
+        t.right_p = right_p
+        self.T.addTrapezoid({t})
+        return t
 
     def initEventStructure(self):
-        # the edge between the first and last point
-        lastEdge = LineSegment(self.polygon.V[0], self.polygon.V[-1])
-
-        # if points have the same x, the point with lowest y goes first
-        for i in range(len(self.polygon.V)):
-            eventPoint = []
-            eventPoint.append(self.polygon.V[i])
-            # the current point is not the first or last one
-            if i != 0:
-                # the edge between the current point and the previous one
-                eventPoint.append(LineSegment(self.polygon.V[i], self.polygon.V[i - 1]))
-            else:
-                eventPoint.append(lastEdge)
-            if i != (len(self.polygon.V) - 1):
-                # the edge between the current point and the next one
-                eventPoint.append(LineSegment(self.polygon.V[i], self.polygon.V[i + 1]))
-            else:
-                eventPoint.append(lastEdge)
-
-            # now also "sort" the edges of an event such that the edge where the point is the endpoint is done first
-            # if the point equals the endpoint (q) of the first edge, we are fine
-            if eventPoint[1].q == eventPoint[0]:
-                pass
-            elif eventPoint[2].q == eventPoint[0]:
-                # in this case we must swap eventPoint[1] and eventPoint[2]
-                eventPoint[1], eventPoint[2] = eventPoint[2], eventPoint[1]
-
-            # now we wish to determine the "case" we have here
-            eventPoint.insert(1, self.determineCase(eventPoint[0], eventPoint[1], eventPoint[2]))
-
-            self.Q.append(eventPoint)
-
+        """
+        Collect the segments that end and start in every endpoint of an edge and sort the
+        endpoints lexicographically. In the symbolically sheared plane of RandomizedIncrementalConstruction
+        a vertical edge runs between two consecutive event points, so it only bounds trapezoids of zero width.
+        """
+        events = {}
+        for edge in self.polygon.E:
+            events.setdefault(edge.p, ([], []))[1].append(edge)
+            events.setdefault(edge.q, ([], []))[0].append(edge)
+        self.Q = [(point, ending, starting) for point, (ending, starting) in events.items()]
         self.Q.sort(key=lambda event: (event[0].x, event[0].y))
 
-    # given a point and two lines connected to this point, determine the configuration they are in
-    def determineCase(self, point, l1, l2):
-        assert (isinstance(point, Point))
-        assert (isinstance(l1, LineSegment))
-        assert (isinstance(l2, LineSegment))
-
-        if l1.isVertical and not l2.isVertical:
-            if l2.p == l1.p or l2.p == l1.q:
-                return "D"
-            elif l2.q == l1.p or l2.q == l1.q:
-                return "E"
-        elif l2.isVertical and not l1.isVertical:
-            if l1.p == l2.p or l1.p == l2.q:
-                return "D"
-            elif l1.q == l2.p or l1.q == l2.q:
-                return "E"
-        elif l1.isVertical and l2.isVertical:
-            return "F"
-        elif point == l1.p and point == l2.p:
-            return "B"
-        elif point == l1.q and point == l2.q:
-            return "C"
-        elif point == l1.q and point == l2.p:
-            return "A"
-        else:
-            raise ValueError("Case not defined")
-
     def computeBoundingBox(self):
-        # find  top right point to create a bounding box (bottom left is [0, 0])
-        topRight = Point(0, 0)
-        bottomLeft = Point(float("inf"), float("inf"))
-
-        for point in self.polygon.V:
-            # find top right
-            if point.get_x() >= topRight.get_x():
-                topRight.set_x(point.get_x() + 1)
-            if point.get_y() >= topRight.get_y():
-                topRight.set_y(point.get_y() + 1)
-
-            # find left bottom
-            if point.get_x() <= bottomLeft.get_x():
-                bottomLeft.set_x(point.get_x() - 1)
-            if point.get_y() <= bottomLeft.get_y():
-                bottomLeft.set_y(point.get_y() - 1)
-
-        # define bounding box edges
-        self.topEdge = LineSegment(Point(bottomLeft.x, topRight.y), Point(topRight.x, topRight.y))
-        self.bottomEdge = LineSegment(Point(bottomLeft.x, bottomLeft.y), Point(topRight.x, bottomLeft.y))
+        # find top right point to create a bounding box, like RandomizedIncrementalConstruction
+        x_s = [point.x for point in self.polygon.V]
+        y_s = [point.y for point in self.polygon.V]
+        self.topRight = Point(max(x_s) + 1, max(y_s) + 1)
+        self.bottomLeft = Point(min(x_s) - 1, min(y_s) - 1)
+
+        # define bounding box edges and put them in the status
+        self.topEdge = LineSegment(Point(self.bottomLeft.x, self.topRight.y), self.topRight)
+        self.bottomEdge = LineSegment(self.bottomLeft, Point(self.topRight.x, self.bottomLeft.y))
+        self.S.insert(self.bottomEdge, self.bottomLeft.x)
+        self.S.insert(self.topEdge, self.bottomLeft.x)
+        self.openTrapezoid(self.bottomLeft, self.topEdge, self.bottomEdge)
 
-        # based on the bounding box dimensions we add events to Q
-        # first insert the top left point of the bounding box since it should be the second event
-        self.Q.insert(0, [self.topEdge.p, "G", self.topEdge])
-        # then insert the bottom left point of the bounding box since it should be the first event
-        self.Q.insert(0, [self.bottomEdge.p, "G", self.bottomEdge])
-        # then append the bottom right point as it should be the second to last event
-        self.Q.append([self.bottomEdge.q, "G", self.bottomEdge])
-        # and finally append the top right point
-        self.Q.append([self.topEdge.q, "G", self.topEdge])
@@ -0,0 +1,167 @@
+from Trapezoid import Trapezoid
+
+
+def contains(trapezoid, x, y) -> bool:
+    """
+    Check in O(1) whether a query point lies strictly between the walls of a
+    trapezoid, on or above its bottom and below its top. Walls are compared in
+    the lexicographic order of the symbolically sheared plane, like the X-nodes.
+    Points on a wall are never contained, they are left to the DAG.
+    :param trapezoid: Trapezoid
+    :param x:
+    :param y:
+    :return:
+    """
+    left_p, right_p = trapezoid.left_p, trapezoid.right_p
+    return (left_p.x < x or (left_p.x == x and left_p.y < y)) \
+        and (x < right_p.x or (x == right_p.x and y < right_p.y)) \
+        and trapezoid.bottom.side_of(x, y) >= 0 > trapezoid.top.side_of(x, y)
+
+
+def step(trapezoid, x, y):
+    """
+    One step of the walk towards a query point that is not contained in trapezoid.
+    Left and right of the walls we cross the wall, into the neighbor on the same side
+    of the segment between the two neighbors as the query point. Above the top or below the bottom we walk along the
+    segment towards its nearer endpoint, around which the walk can leave it.
+    :return: the next trapezoid, None if the walk cannot continue
+    """
+    left_p, right_p = trapezoid.left_p, trapezoid.right_p
+    left_of = x < left_p.x or (x == left_p.x and y <= left_p.y)
+    if left_of or x > right_p.x or (x == right_p.x and y >= right_p.y):
+        if left_of:
+            upper, lower = trapezoid.upper_left, trapezoid.lower_left
+        else:
+            upper, lower = trapezoid.upper_right, trapezoid.lower_right
+        if upper is None or lower is None or upper is lower:
+            return upper if upper is not None else lower
+        # the two neighbors are separated by the bottom of the upper one
+        return upper if upper.bottom.side_of(x, y) >= 0 else lower
+
+    above = trapezoid.top.side_of(x, y) >= 0
+    segment = trapezoid.top if above else trapezoid.bottom
+    if segment.isVertical:
+        # a vertical segment runs from its lower to its upper endpoint in the sheared plane
+        nearer_left = y - segment.p.y < segment.q.y - y
+    else:
+        nearer_left = x - segment.p.x < segment.q.x - x
+    if nearer_left:
+        upper, lower = trapezoid.upper_left, trapezoid.lower_left
+    else:
+        upper, lower = trapezoid.upper_right, trapezoid.lower_right
+    if above:
+        return upper if upper is not None else lower
+    return lower if lower is not None else upper
+
+
+def walk(hint, x, y, max_steps):
+    """
+    Walk from hint through the neighbor links towards a query point
+    :param hint: a trapezoid of the map
+    :param max_steps: number of trapezoids to visit after hint
+    :return: (trapezoid, steps), the trapezoid that contains (x, y) or None if it was
+        not reached, and the number of steps taken
+    """
+    t, previous = hint, None
+    for steps in range(max_steps + 1):
+        if contains(t, x, y):
+            return t, steps
+        if steps == max_steps:
+            break
+        before = previous
+        t, previous = step(t, x, y), t
+        if t is None or t is before:
+            # no neighbor in that direction, or the walk turned back
+            return None, steps + 1
+    return None, max_steps
+
+
+class LocationStream:
+    """
+    Point location for spatially coherent query streams, e.g. the consecutive
+    positions of a vehicle. Every query first checks a small cache of recent
+    results, then walks from the most recent result through the neighbor links
+    and only falls back to a search from the root of the DAG when the walk did
+    not reach the query point within max_steps trapezoids.
+
+    The stream holds on to trapezoids of the live map, cached trapezoids that
+    have left the map after an insertion or deletion are dropped on use.
+    """
+
+    def __init__(self, construction, cache_size=4, max_steps=8):
+        """
+        :param construction: the RandomizedIncrementalConstruction to query
+        :param cache_size: number of recent results to check before walking
+        :param max_steps: number of trapezoids the walk may visit before the DAG is searched
+        """
+        assert cache_size > 0 and max_steps >= 0
+        self.construction = construction
+        self.cache_size = cache_size
+        self.max_steps = max_steps
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the recent results and zero the counters
+        """
+        # most recent result first
+        self.recent = []
+        self.queries = 0
+        self.cache_hits = 0
+        self.walk_hits = 0
+        self.fallbacks = 0
+        self.steps = 0
+
+    def locate(self, x, y) -> Trapezoid:
+        """
+        Locate a query point
+        :param x:
+        :param y:
+        :return: the trapezoid of the map that contains (x, y)
+        """
+        self.queries += 1
+        live = self.construction.T.trapezoids
+        recent = self.recent
+        for i, t in enumerate(recent):
+            if contains(t, x, y):
+                if t in live:
+                    self.cache_hits += 1
+                    if i:
+                        del recent[i]
+                        recent.insert(0, t)
+                    return t
+                del recent[i]
+                break
+
+        while recent and recent[0] not in live:
+            del recent[0]
+        t, steps = walk(recent[0], x, y, self.max_steps) if recent else (None, 0)
+        self.steps += steps
+        if t is not None:
+            self.walk_hits += 1
+        else:
+            self.fallbacks += 1
+            t = self.construction.T.G.locate(x, y).graph_object
+
+        recent.insert(0, t)
+        del recent[self.cache_size:]
+        return t
+
+    def locate_region(self, x, y):
+        """
+        Locate the region of a polygon or polygon set that contains a point
+        :return: region label, None if the point lies outside every region
+        """
+        return self.construction.polygon.region_of(self.locate(x, y))
+
+    def as_dict(self) -> dict:
+        """
+        The counters and the average number of walk steps per query
+        :return:
+        """
+        return {'queries': self.queries, 'cache_hits': self.cache_hits, 'walk_hits': self.walk_hits,
+                'fallbacks': self.fallbacks, 'steps_per_query': self.steps / max(self.queries, 1)}
+
+    def __repr__(self):
+        return '<LocationStream queries:%d cache_hits:%d walk_hits:%d fallbacks:%d>' % (
+            self.queries, self.cache_hits, self.walk_hits, self.fallbacks)
@@ -0,0 +1,390 @@
+import math
+from bisect import bisect_left
+from heapq import heappush, heappop
+
+import numpy as np
+
+from Trapezoid import Trapezoid
+
+
+class VersionNode:
+    """
+    Node of the partially persistent search tree. Besides the children it was
+    created with, it has one extra child slot, which is filled by the first
+    later version that changes a child. A node whose extra slot is taken is
+    copied instead, so every update costs O(1) amortized space.
+    """
+
+    __slots__ = ('trapezoid', 'left', 'right', 'version', 'mod')
+
+    def __init__(self, trapezoid, left, right, version):
+        self.trapezoid = trapezoid
+        self.left = left
+        self.right = right
+        self.version = version
+        # (version, is_left, child) once a later version changed a child
+        self.mod = None
+
+    def child(self, is_left, version):
+        """
+        The left or right child in a version
+        """
+        mod = self.mod
+        if mod is not None and mod[1] is is_left and mod[0] <= version:
+            return mod[2]
+        return self.left if is_left else self.right
+
+
+class TreeNode:
+    """
+    Node of the red-black tree of the current sweep line. It only holds the
+    latest version, its image is the VersionNode that represents it in the
+    persistent tree.
+    """
+
+    __slots__ = ('trapezoid', 'left', 'right', 'parent', 'red', 'image', 'height')
+
+    def __init__(self, trapezoid, image):
+        self.trapezoid = trapezoid
+        self.left = None
+        self.right = None
+        self.parent = None
+        self.red = True
+        self.image = image
+        # number of nodes on the longest path down from this node
+        self.height = 1
+
+
+class PersistentSlabIndex:
+    """
+    Slab point-location index in a partially persistent balanced search tree.
+
+    The sweep keeps the trapezoids that cross the sweep line in a red-black
+    tree, ordered from bottom to top. Every event point replaces a run of
+    closed trapezoids by the trapezoids opened right of it, after which the
+    changed child pointers are committed into a persistent copy of the tree
+    with node copying (Sarnak and Tarjan). Every slab between two event points
+    is one version, which keeps its own root. The colors and parents are only
+    needed for the updates and are not persistent.
+
+    Red-black trees only do O(1) amortized rotations per update, so the
+    persistent tree takes O(n) space, and a query is a binary search over the
+    event points followed by a search down a tree of depth O(log n).
+
+    Query points are compared to event points like in the X-nodes of a DAG:
+    a point with the x-coordinate of an event point lies right of it only if it
+    lies above it. Points on a segment count as above it.
+    """
+
+    def __init__(self, trapezoid):
+        """
+        :param trapezoid: the trapezoid left of the first event point, the bounding box
+        """
+        self.events = []
+        self.roots = []
+        self.version = 0
+        self.root = None
+        self.dirty = set()
+        # the tree node of every trapezoid that crosses the sweep line
+        self.nodes = {}
+        self.n_images = 0
+        # the largest height of the tree in any version
+        self.height = 0
+
+        self.trapezoids = []
+        self.ids = {}
+        self.insert_after(None, trapezoid)
+        self.commit()
+
+    def __len__(self):
+        return len(self.roots)
+
+    @property
+    def size(self) -> int:
+        """
+        Number of nodes of the persistent tree
+        """
+        return self.n_images
+
+    def query_depth(self) -> int:
+        """
+        Number of comparisons on the longest search path: the binary search over
+        the event points and the longest path down the tree of a version
+        :return:
+        """
+        return math.ceil(math.log2(len(self.events) + 1)) + self.height
+
+    def update(self, point, closed, opened):
+        """
+        Record the changes of the sweep line at an event point
+        :param point: the event point
+        :param closed: the trapezoids that end at the point, from bottom to top
+        :param opened: the trapezoids that start at the point, from bottom to top
+        """
+        self.version += 1
+        self.events.append((point.x, point.y))
+        node = self.nodes[closed[0]]
+        before = self.predecessor(node)
+        for t in closed:
+            self.delete(self.nodes.pop(t))
+        for t in opened:
+            before = self.insert_after(before, t)
+        self.commit()
+
+    def locate(self, x, y) -> Trapezoid:
+        """
+        Locate a single point
+        :param x:
+        :param y:
+        :return: the trapezoid containing (x, y)
+        """
+        version = bisect_left(self.events, (x, y))
+        node = self.roots[version]
+        # the lowest trapezoid whose top lies above the point
+        found = node.trapezoid
+        while node is not None:
+            if node.trapezoid.top.side_of(x, y) < 0:
+                found = node.trapezoid
+                node = node.child(True, version)
+            else:
+                node = node.child(False, version)
+        return found
+
+    def locate_many(self, xs, ys) -> np.ndarray:
+        """
+        Locate many points, one search per point
+        :param xs: x-coordinates of the query points
+        :param ys: y-coordinates of the query points
+        :return: array with the id of the containing trapezoid of every point, an index into trapezoids
+        """
+        xs = np.asarray(xs, dtype=np.float64).ravel()
+        ys = np.asarray(ys, dtype=np.float64).ravel()
+        assert xs.shape == ys.shape, 'xs and ys must have the same length'
+        ids, locate = self.ids, self.locate
+        return np.array([ids[locate(x, y)] for x, y in zip(xs.tolist(), ys.tolist())], dtype=np.int32)
+
+    def slab(self, version) -> list:
+        """
+        The trapezoids of a slab from bottom to top
+        :param version: index of the slab, 0 is left of the first event point
+        :return:
+        """
+        result, stack, node = [], [], self.roots[version]
+        while stack or node is not None:
+            if node is not None:
+                stack.append(node)
+                node = node.child(True, version)
+            else:
+                node = stack.pop()
+                result.append(node.trapezoid)
+                node = node.child(False, version)
+        return result
+
+    def commit(self):
+        """
+        Write the child pointers that changed since the last version into the
+        persistent tree, the deepest nodes first: a node that has to be copied
+        changes the child pointer of its parent. The heights of the changed
+        nodes are updated on the way, and those of their ancestors if they change.
+        """
+        version = self.version
+        heap = []
+        for node in self.dirty:
+            heappush(heap, (-self.depth(node), id(node), node))
+        self.dirty.clear()
+        done = set()
+        while heap:
+            _, key, node = heappop(heap)
+            if key in done:
+                continue
+            done.add(key)
+
+            height = 1 + max(node.left.height if node.left is not None else 0,
+                             node.right.height if node.right is not None else 0)
+            if height != node.height:
+                node.height = height
+                if node.parent is not None:
+                    heappush(heap, (-self.depth(node.parent), id(node.parent), node.parent))
+
+            image = node.image
+            left = node.left.image if node.left is not None else None
+            right = node.right.image if node.right is not None else None
+            if image.version == version:
+                image.left, image.right = left, right
+                continue
+            changes = [(is_left, child) for is_left, child in ((True, left), (False, right))
+                       if image.child(is_left, version) is not child]
+            if not changes:
+                continue
+            if len(changes) == 1 and image.mod is None:
+                image.mod = (version, changes[0][0], changes[0][1])
+                continue
+            # the extra slot is taken, so copy the node and point its parent to the copy
+            node.image = VersionNode(node.trapezoid, left, right, version)
+            self.n_images += 1
+            if node.parent is not None:
+                heappush(heap, (-self.depth(node.parent), id(node.parent), node.parent))
+
+        self.roots.append(self.root.image)
+        self.height = max(self.height, self.root.height)
+
+    def depth(self, node) -> int:
+        depth = 0
+        while node.parent is not None:
+            node = node.parent
+            depth += 1
+        return depth
+
+    def link(self, parent, is_left, child):
+        """
+        Make child the left or right child of parent, or the root if parent is None
+        """
+        if parent is None:
+            self.root = child
+        else:
+            if is_left:
+                parent.left = child
+            else:
+                parent.right = child
+            self.dirty.add(parent)
+        if child is not None:
+            child.parent = parent
+
+    def transplant(self, node, child):
+        """
+        Put child in the place of node
+        """
+        parent = node.parent
+        self.link(parent, parent is not None and parent.left is node, child)
+
+    def rotate(self, node, is_left):
+        """
+        Rotate the right child of node above it if is_left, otherwise the left child
+        """
+        pivot = node.right if is_left else node.left
+        self.link(node, not is_left, pivot.left if is_left else pivot.right)
+        self.transplant(node, pivot)
+        self.link(pivot, is_left, node)
+
+    def insert_after(self, before, trapezoid) -> TreeNode:
+        """
+        Insert a trapezoid directly above the one of node before
+        :param before: TreeNode, None to insert the trapezoid at the bottom
+        :return: the new TreeNode
+        """
+        image = VersionNode(trapezoid, None, None, self.version)
+        self.n_images += 1
+        node = TreeNode(trapezoid, image)
+        self.nodes[trapezoid] = node
+        self.dirty.add(node)
+        self.ids[trapezoid] = len(self.trapezoids)
+        self.trapezoids.append(trapezoid)
+
+        if self.root is None:
+            self.link(None, True, node)
+        elif before is None:
+            self.link(leftmost(self.root), True, node)
+        elif before.right is None:
+            self.link(before, False, node)
+        else:
+            self.link(leftmost(before.right), True, node)
+        self.insert_fixup(node)
+        return node
+
+    def insert_fixup(self, node):
+        while node.parent is not None and node.parent.red:
+            parent = node.parent
+            grandparent = parent.parent
+            is_left = parent is grandparent.left
+            uncle = grandparent.right if is_left else grandparent.left
+            if is_red(uncle):
+                parent.red = uncle.red = False
+                grandparent.red = True
+                node = grandparent
+                continue
+            if node is (parent.right if is_left else parent.left):
+                node = parent
+                self.rotate(node, is_left)
+                parent = node.parent
+            parent.red = False
+            grandparent.red = True
+            self.rotate(grandparent, not is_left)
+        self.root.red = False
+
+    def delete(self, node):
+        """
+        Remove a node from the tree, without changing the trapezoids of other nodes
+        """
+        removed_red = node.red
+        if node.left is None or node.right is None:
+            child = node.left if node.left is not None else node.right
+            parent = node.parent
+            self.transplant(node, child)
+        else:
+            successor = leftmost(node.right)
+            removed_red = successor.red
+            child = successor.right
+            if successor.parent is node:
+                parent = successor
+            else:
+                parent = successor.parent
+                self.transplant(successor, child)
+                self.link(successor, False, node.right)
+            self.transplant(node, successor)
+            self.link(successor, True, node.left)
+            successor.red = node.red
+        self.dirty.discard(node)
+        if not removed_red:
+            self.delete_fixup(child, parent)
+
+    def delete_fixup(self, node, parent):
+        while node is not self.root and not is_red(node):
+            is_left = node is parent.left
+            sibling = parent.right if is_left else parent.left
+            if sibling.red:
+                sibling.red = False
+                parent.red = True
+                self.rotate(parent, is_left)
+                sibling = parent.right if is_left else parent.left
+            near, far = (sibling.left, sibling.right) if is_left else (sibling.right, sibling.left)
+            if not is_red(near) and not is_red(far):
+                sibling.red = True
+                node, parent = parent, parent.parent
+                continue
+            if not is_red(far):
+                near.red = False
+                sibling.red = True
+                self.rotate(sibling, not is_left)
+                sibling = parent.right if is_left else parent.left
+                far = sibling.right if is_left else sibling.left
+            sibling.red = parent.red
+            parent.red = False
+            far.red = False
+            self.rotate(parent, is_left)
+            node = self.root
+        if node is not None:
+            node.red = False
+
+    @staticmethod
+    def predecessor(node):
+        if node.left is not None:
+            node = node.left
+            while node.right is not None:
+                node = node.right
+            return node
+        while node.parent is not None and node.parent.left is node:
+            node = node.parent
+        return node.parent
+
+    def __repr__(self):
+        return '<PersistentSlabIndex slabs:%d nodes:%d>' % (len(self.roots), self.n_images)
+
+
+def is_red(node) -> bool:
+    return node is not None and node.red
+
+
+def leftmost(node):
+    while node.left is not None:
+        node = node.left
+    return node
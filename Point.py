@@ -1,38 +1,41 @@
 from GraphObject import GraphObject
 
+_setattr = object.__setattr__
+
 
 class Point(GraphObject):
+    """
+    Immutable point. Coordinates are plain slots, so reading them is a
+    direct attribute access.
+    """
+
+    __slots__ = ('x', 'y')
+
     def __init__(self, x, y):
-        super().__init__()
-        self.x = x
-        self.y = y
+        assert x >= 0.0 and y >= 0.0, \
+            'Points must have positive coordinates: (%s, %s)' % (x, y)
+        _setattr(self, 'x', x)
+        _setattr(self, 'y', y)
 
     def get_x(self):
-        return self._x
+        return self.x
 
     def get_y(self):
-        return self._y
-
-    def set_x(self, x):
-        assert isinstance(float(x), float) and x >= 0.0, \
-            'Points must have positive integer x-coordinate: %d' % x
-        self._x = x
+        return self.y
 
-    def set_y(self, y):
-        assert isinstance(float(y), float) and y >= 0.0, \
-            'Points must have positive integer y-coordinate: %d' % y
-        self._y = y
+    def __setattr__(self, key, value):
+        raise AttributeError('Point is immutable')
 
-    x = property(get_x, set_x)
-    y = property(get_y, set_y)
+    def __reduce__(self):
+        return self.__class__, (self.x, self.y)
 
     def __hash__(self):
-        return super().__hash__()
+        return hash((self.x, self.y))
 
     def __eq__(self, other):
         """Override the default Equals behavior"""
         if isinstance(other, self.__class__):
-            return self.__dict__ == other.__dict__
+            return self.x == other.x and self.y == other.y
         return NotImplemented
 
     def __ne__(self, other):
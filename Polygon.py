@@ -1,25 +1,105 @@
 from Point import Point
 from LineSegment import LineSegment
+from ShamosHoey import find_crossing
+
+
+class InvalidPolygonError(ValueError):
+    """
+    Raised for input that does not describe a simple polygon
+    """
+    def __init__(self, message, crossing=None):
+        """
+        :param message:
+        :param crossing: the pair of edges that cross, None if the input is invalid otherwise
+        """
+        super().__init__(message)
+        self.crossing = crossing
 
 
 class Polygon:
     """
     Class representing a polygon with a set of points and edges between them.
-    """
-    def __init__(self, points):
-        assert isinstance(points, list) and all(isinstance(p, Point) for p in points)
-        self.V = points
+    The boundary is one outer ring and optionally a number of hole rings.
 
-        # check if points assume general position
-        # assert self.is_general_position, 'Input points must have distinct x-coordinates'
+    Every edge knows the region on either side of it: `sides` maps an edge to
+    the labels of the regions below and above it, None for the outside. A
+    trapezoid of the decomposition lies below its top segment, which is how
+    region_of labels it.
+    """
+    def __init__(self, points, holes=(), label=0, validate=True):
+        """
+        :param points: vertices of the outer ring
+        :param holes: vertex lists of the hole rings, which lie inside the outer ring and do not touch each other
+        :param label: label of the region bounded by the rings
+        :param validate: check in O(n log n) that no two edges cross or touch other than in a shared vertex
+        """
+        if not (isinstance(points, list) and all(isinstance(p, Point) for p in points)):
+            raise TypeError('points must be a list of Points')
+        if not all(isinstance(hole, list) and all(isinstance(p, Point) for p in hole) for hole in holes):
+            raise TypeError('every hole must be a list of Points')
+        self.shells = [points]
+        self.holes = list(holes)
+        self.rings = self.shells + self.holes
+        self.V = [p for ring in self.rings for p in ring]
+        self.label = label
 
         # create edges and randomize
         self.E = []
-        for i, p in enumerate(points):
-            self.E.append(LineSegment(p, points[(i + 1) % len(points)]))
+        self.sides = {}
+        for ring in self.rings:
+            # the interior lies left of a counter-clockwise outer ring and right of a counter-clockwise hole
+            interior_left = (signed_area(ring) > 0) == (ring is points)
+            for a, b in zip(ring, ring[1:] + ring[:1]):
+                edge = LineSegment(a, b)
+                self.E.append(edge)
+                # an edge directed to the right has its left side above it. In the symbolically
+                # sheared plane of the decomposition this holds for vertical edges as well,
+                # which are directed upwards and have their left side above them
+                interior_above = (edge.p is a) == interior_left
+                self.sides[edge] = [None, label] if interior_above else [label, None]
 
         # check if points represent a simple polygon
-        # assert self.is_simple_polygon, 'Input polygon must be simple'
+        if validate:
+            self.validate()
+
+    @classmethod
+    def from_arrays(cls, xs, ys, validate=True):
+        """
+        Create a polygon from coordinate arrays (lists or numpy arrays)
+        :param xs: x-coordinates of the vertices
+        :param ys: y-coordinates of the vertices
+        :param validate: check that the polygon is simple
+        :return: Polygon
+        """
+        if len(xs) != len(ys):
+            raise InvalidPolygonError('xs and ys must have the same length')
+        if hasattr(xs, 'tolist'):
+            # convert numpy scalars to Python numbers once for the whole array
+            xs, ys = xs.tolist(), ys.tolist()
+        return cls(list(map(Point, xs, ys)), validate=validate)
+
+    def validate(self):
+        """
+        Check that the polygon is simple
+        :raises InvalidPolygonError: with the first pair of edges that crosses
+        """
+        crossing = self.find_crossing()
+        if crossing is not None:
+            raise InvalidPolygonError('Input polygon must be simple: %s and %s intersect' % crossing, crossing)
+
+    def region_of(self, trapezoid):
+        """
+        Label of the region a trapezoid of the decomposition lies in
+        :param trapezoid:
+        :return: region label, None if the trapezoid lies outside every region
+        """
+        sides = self.sides.get(trapezoid.top)
+        if sides is not None:
+            return sides[0]
+        sides = self.sides.get(trapezoid.bottom)
+        if sides is not None:
+            return sides[1]
+        return None
 
     @property
     def is_general_position(self) -> bool:
@@ -28,9 +108,21 @@ class Polygon:
         vertex has distinct x-coordinate
         :return:
         """
-        x_s = [p.x for p in self.V]
-        print(sorted(x_s))
-        return len(x_s) == len(set(x_s))
+        return not self.duplicate_x()
+
+    def duplicate_x(self) -> list:
+        """
+        The vertices that share their x-coordinate with another vertex, found by sorting
+        :return: list of lists of vertices with equal x-coordinates, ordered by x and then y
+        """
+        V = sorted(set(self.V), key=lambda p: (p.x, p.y))
+        groups, start = [], 0
+        for i in range(1, len(V) + 1):
+            if i == len(V) or V[i].x != V[start].x:
+                if i - start > 1:
+                    groups.append(V[start:i])
+                start = i
+        return groups
 
     @property
     def is_simple_polygon(self) -> bool:
@@ -38,12 +130,14 @@ class Polygon:
         Check if the given polygon is simple or complex.
         :return: True if simple. False otherwise.
         """
-        for i, s1 in enumerate(self.E):
-            for j, s2 in enumerate(self.E[i + 1:]):
-                if s1.intersects(s2):
-                    print('Segments %s and %s intersect' % (str(s1), str(s2)))
-                    return False
-        return True
+        return self.find_crossing() is None
+
+    def find_crossing(self):
+        """
+        The first pair of edges that cross, overlap or touch other than in a shared vertex, see ShamosHoey
+        :return: (edge, edge), None if the polygon is simple
+        """
+        return find_crossing(self.E)
 
     def __hash__(self):
         return super().__hash__()
@@ -59,3 +153,54 @@ class Polygon:
         if isinstance(other, self.__class__):
             return not self == other
         return NotImplemented
+
+
+class PolygonSet(Polygon):
+    """
+    Class representing a set of non-overlapping polygons, each with its own
+    label, that are decomposed together into a single trapezoidal map. An edge
+    shared by two neighboring polygons is kept once, with a region on both sides.
+    """
+    def __init__(self, polygons, labels=None, validate=True):
+        """
+        :param polygons: list of Polygons
+        :param labels: label of every polygon, by default the label the polygon was created with
+        :param validate: check that the edges of different polygons do not cross either
+        """
+        if not (isinstance(polygons, list) and all(isinstance(p, Polygon) for p in polygons)):
+            raise TypeError('polygons must be a list of Polygons')
+        if labels is None:
+            labels = [p.label for p in polygons]
+        if len(labels) != len(polygons):
+            raise ValueError('there must be one label per polygon')
+        self.polygons = polygons
+        self.labels = list(labels)
+        self.shells = [ring for polygon in polygons for ring in polygon.shells]
+        self.holes = [ring for polygon in polygons for ring in polygon.holes]
+        self.rings = self.shells + self.holes
+        # shared vertices are kept once
+        self.V = list(dict.fromkeys(p for polygon in polygons for p in polygon.V))
+        self.label = None
+
+        # shared edges are kept once
+        self.E = list(dict.fromkeys(edge for polygon in polygons for edge in polygon.E))
+        self.sides = {}
+        for polygon, label in zip(polygons, self.labels):
+            for edge, (below, above) in polygon.sides.items():
+                sides = self.sides.setdefault(edge, [None, None])
+                if below is not None:
+                    sides[0] = label
+                if above is not None:
+                    sides[1] = label
+
+        if validate:
+            self.validate()
+
+
+def signed_area(ring):
+    """
+    Twice the signed area of a ring, positive if it is counter-clockwise
+    :param ring: list of Points
+    :return:
+    """
+    return sum(a.x * b.y - b.x * a.y for a, b in zip(ring, ring[1:] + ring[:1]))
@@ -0,0 +1,75 @@
+import struct
+
+import numpy as np
+
+from Polygon import Polygon
+
+# binary vertex files: magic, value type ('i' for int32, 'd' for float64) and the
+# number of vertices, followed by the (x, y) pairs in little-endian order
+BINARY_MAGIC = b'VPOL'
+BINARY_HEADER = struct.Struct('<4sc3xQ')
+BINARY_TYPES = {b'i': np.dtype('<i4'), b'd': np.dtype('<f8')}
+
+
+def read_vertices(file_name):
+    """
+    Read the vertex coordinates of a polygon file in bulk. Text files start
+    with the number of vertices followed by one "x y" pair per line; binary
+    files are recognized by their header.
+    :param file_name:
+    :return: numpy arrays xs, ys
+    """
+    with open(file_name, 'rb') as file:
+        head = file.read(BINARY_HEADER.size)
+        if head[:len(BINARY_MAGIC)] == BINARY_MAGIC:
+            _, value_type, n = BINARY_HEADER.unpack(head)
+            if value_type not in BINARY_TYPES:
+                raise ValueError('%s: unknown vertex type %r' % (file_name, value_type))
+            values = np.fromfile(file, dtype=BINARY_TYPES[value_type], count=2 * n)
+        else:
+            tokens = (head + file.read()).split()
+            n = int(tokens[0])
+            tokens = tokens[1:2 * n + 1]
+            try:
+                values = np.array(tokens, dtype=np.int64)
+            except ValueError:
+                values = np.array(tokens, dtype=np.float64)
+
+    if len(values) != 2 * n:
+        raise ValueError('%s: expected %d vertices, found %d coordinates' % (file_name, n, len(values)))
+    values = values.reshape(n, 2)
+    return values[:, 0], values[:, 1]
+
+
+def write_vertices(file_name, xs, ys, value_type='i'):
+    """
+    Write vertex coordinates in the binary format
+    :param file_name:
+    :param xs:
+    :param ys:
+    :param value_type: 'i' for int32 or 'd' for float64 coordinates
+    :return:
+    """
+    dtype = BINARY_TYPES[value_type.encode()]
+    values = np.empty((len(xs), 2), dtype=dtype)
+    values[:, 0] = xs
+    values[:, 1] = ys
+    with open(file_name, 'wb') as file:
+        file.write(BINARY_HEADER.pack(BINARY_MAGIC, value_type.encode(), len(values)))
+        values.tofile(file)
+
+
+def load_polygon(file_name, offset=None, validate=True) -> Polygon:
+    """
+    Load a polygon from a text or binary vertex file
+    :param file_name:
+    :param offset: added to every coordinate. By default this is 1, or more
+    if the file has negative coordinates, so that all coordinates are at
+    least 1 (see main.load_input)
+    :param validate: check that the polygon is simple, see Polygon.validate
+    :return: Polygon
+    """
+    xs, ys = read_vertices(file_name)
+    if offset is None:
+        offset = 1 - min(0, xs.min(), ys.min())
+    return Polygon.from_arrays(xs + offset, ys + offset, validate=validate)
@@ -0,0 +1,106 @@
+"""
+Filtered exact geometric predicates.
+
+Every predicate first evaluates its determinant with the given numbers. For
+integer coordinates Python's int arithmetic is already exact, so the sign is
+returned directly. Otherwise the floating-point result is accepted when it
+lies outside a forward error bound; only when the filter is inconclusive is
+the determinant evaluated again with exact rational arithmetic. Floats are
+converted to Fractions without rounding, so the fallback sign is exact for
+the coordinates as stored.
+
+The error bounds assume that every coordinate is exactly representable as a
+float, i.e. integers below 2**53 in magnitude when mixed with floats.
+"""
+from fractions import Fraction
+
+# unit roundoff of IEEE 754 double precision
+EPSILON = 2.0 ** -53
+# error bound of the 2x2 orientation determinant, see Shewchuk's orient2d
+ORIENTATION_BOUND = (3.0 + 16.0 * EPSILON) * EPSILON
+# error bound of the comparison of two lines at an x-coordinate, which
+# rounds at most seven times on the way to its largest term
+HEIGHT_BOUND = 16.0 * EPSILON
+
+
+def exact(value):
+    """
+    Exact representation of a coordinate, ints are left as they are
+    """
+    return value if isinstance(value, int) else Fraction(value)
+
+
+def sign(value) -> int:
+    return (value > 0) - (value < 0)
+
+
+def orientation(px, py, qx, qy, rx, ry) -> int:
+    """
+    Orientation of the triangle p, q, r
+    :return: 1 if r lies left of the directed line p -> q (counter-clockwise),
+        -1 if it lies right of it (clockwise) and 0 if the points are collinear
+    """
+    left = (qx - px) * (ry - py)
+    right = (qy - py) * (rx - px)
+    det = left - right
+    if isinstance(det, int):
+        return sign(det)
+
+    bound = ORIENTATION_BOUND * (abs(left) + abs(right))
+    if det > bound:
+        return 1
+    if det < -bound:
+        return -1
+
+    px, py, qx, qy, rx, ry = map(exact, (px, py, qx, qy, rx, ry))
+    return sign((qx - px) * (ry - py) - (qy - py) * (rx - px))
+
+
+def compare_heights(p1x, p1y, q1x, q1y, p2x, p2y, q2x, q2y, x) -> int:
+    """
+    Compare the heights of two non-vertical lines at x. Both lines are given by
+    two points with p.x < q.x.
+    :return: 1 if line 1 lies above line 2 at x, -1 if it lies below and 0 if they meet at x
+    """
+    dx1, dy1 = q1x - p1x, q1y - p1y
+    dx2, dy2 = q2x - p2x, q2y - p2y
+    # the height of line i is pi.y + (x - pi.x) * dyi / dxi, multiply both by dx1 * dx2 > 0
+    a1, b1 = p1y * dx1 * dx2, (x - p1x) * dy1 * dx2
+    a2, b2 = p2y * dx2 * dx1, (x - p2x) * dy2 * dx1
+    det = (a1 + b1) - (a2 + b2)
+    if isinstance(det, int):
+        return sign(det)
+
+    bound = HEIGHT_BOUND * (abs(a1) + abs(b1) + abs(a2) + abs(b2))
+    if det > bound:
+        return 1
+    if det < -bound:
+        return -1
+
+    p1x, p1y, q1x, q1y, p2x, p2y, q2x, q2y, x = map(exact, (p1x, p1y, q1x, q1y, p2x, p2y, q2x, q2y, x))
+    dx1, dy1 = q1x - p1x, q1y - p1y
+    dx2, dy2 = q2x - p2x, q2y - p2y
+    return sign((p1y * dx1 + (x - p1x) * dy1) * dx2 - (p2y * dx2 + (x - p2x) * dy2) * dx1)
+
+
+def compare_slopes(p1x, p1y, q1x, q1y, p2x, p2y, q2x, q2y) -> int:
+    """
+    Compare the slopes of two non-vertical lines, both given by two points with p.x < q.x
+    :return: 1 if line 1 is steeper than line 2, -1 if it is less steep and 0 if they are parallel
+    """
+    dx1, dy1 = q1x - p1x, q1y - p1y
+    dx2, dy2 = q2x - p2x, q2y - p2y
+    left = dy1 * dx2
+    right = dy2 * dx1
+    det = left - right
+    if isinstance(det, int):
+        return sign(det)
+
+    bound = HEIGHT_BOUND * (abs(left) + abs(right))
+    if det > bound:
+        return 1
+    if det < -bound:
+        return -1
+
+    p1x, p1y, q1x, q1y, p2x, p2y, q2x, q2y = map(exact, (p1x, p1y, q1x, q1y, p2x, p2y, q2x, q2y))
+    return sign((q1y - p1y) * (q2x - p2x) - (q2y - p2y) * (q1x - p1x))
@@ -1,32 +1,527 @@
 from Polygon import Polygon, Point, LineSegment
-from TrapezoidMap import TrapezoidMap, Trapezoid
+from TrapezoidMap import TrapezoidMap, Trapezoid, BaseTrapezoid
+from Trapezoid import FrozenTrapezoid
+from TrapezoidStore import TrapezoidStore, DepthColumn
 from DAG import DAG, DAGNode
-from itertools import groupby
+from FrozenDAG import FrozenDAG
+from Instrumentation import Instrumentation
+from LocationStream import LocationStream, contains, walk
+from concurrent.futures import ProcessPoolExecutor
+from bisect import bisect_left, bisect_right
+import math
 import random
+import sys
 
 
 class RandomizedIncrementalConstruction:
-    def __init__(self, polygon):
+    def __init__(self, polygon, store='set', seed=None, max_depth_factor=None, max_rebuilds=10,
+                 instrumentation=None):
+        """
+        :param polygon: Polygon to decompose
+        :param store: 'set' to keep the trapezoids as objects in a set, 'array' to keep them
+            in the columns of a TrapezoidStore
+        :param seed: seed of the insertion order, None to use the global random state
+        :param max_depth_factor: rebuild with a new insertion order as soon as the longest
+            search path exceeds max_depth_factor * ln(n + 1) for n segments, None to never rebuild
+        :param max_rebuilds: keep the structure of the last attempt after this many rebuilds
+        :param instrumentation: Instrumentation that collects counters and insert times, None to disable
+        """
         assert isinstance(polygon, Polygon)
+        if store not in ('set', 'array'):
+            raise ValueError("store must be 'set' or 'array', not %r" % (store,))
+        assert max_depth_factor is None or max_depth_factor > 0
+        assert instrumentation is None or isinstance(instrumentation, Instrumentation)
         self.polygon = polygon
-        self.T = TrapezoidMap(set())
+        self.store = store
+        self.seed = seed
+        self.random = random if seed is None else random.Random(seed)
+        self.max_depth_factor = max_depth_factor
+        self.max_rebuilds = max_rebuilds
+        self.rebuilds = 0
+        self.instrumentation = instrumentation
+        self.reset()
         self.computeDecomposition()
 
+    @classmethod
+    def best_of(cls, polygon, k, seed=0, workers=None, **kwargs):
+        """
+        Build k seeded insertion orders in parallel processes and keep the one
+        with the shallowest search structure. The workers only report the depth
+        of their build, the winning seed is then rebuilt in this process.
+        :param polygon: Polygon to decompose
+        :param k: number of seeds to try, seed .. seed + k - 1
+        :param seed: first seed
+        :param workers: number of worker processes (default: number of CPUs)
+        :param kwargs: other arguments for the constructor
+        :return: RandomizedIncrementalConstruction
+        """
+        assert k > 0
+        seeds = list(range(seed, seed + k))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            depths = list(executor.map(build_depth, [polygon] * k, seeds, [kwargs] * k))
+        best = min(range(k), key=lambda i: depths[i])
+        return cls(polygon, seed=seeds[best], **kwargs)
+
+    def reset(self):
+        """
+        Start over with an empty map
+        """
+        self.T = TrapezoidMap(TrapezoidStore() if self.store == 'array' else set())
+        self.T.instrumentation = self.instrumentation
+        self.frozen = None
+        # length of the search path to the leaf of every trapezoid in the map,
+        # a column of the store so that it does not hold on to the views
+        self.depth = DepthColumn(self.T.trapezoids) if self.store == 'array' else {}
+        self.max_depth = 0
+        # number of segments in the map that end in every point
+        self.endpoints = {}
+        # the DAG leaves of a trapezoid other than its node, see reuseLeaves
+        self.leaves = {}
+
     def getTrapezoidalMap(self) -> TrapezoidMap:
         return self.T
 
+    def getFrozenDAG(self) -> FrozenDAG:
+        """
+        Flattened copy of the search structure, rebuilt after the map changed
+        :return: FrozenDAG
+        """
+        if self.frozen is None:
+            self.frozen = self.T.G.freeze()
+        return self.frozen
+
+    def locate_many(self, xs, ys):
+        """
+        Locate a batch of query points in the decomposition
+        :param xs: x-coordinates of the query points
+        :param ys: y-coordinates of the query points
+        :return: numpy array of trapezoid ids, indices into getFrozenDAG().trapezoids
+        """
+        return self.getFrozenDAG().locate_many(xs, ys)
+
+    def locate(self, x, y, hint=None, max_steps=8) -> Trapezoid:
+        """
+        Locate a query point in the live map. With a hint, e.g. the answer of the
+        previous query, the point is first searched by walking from the hint through
+        the neighbor links, the DAG is only searched if that takes more than max_steps.
+        After compact there are no neighbor links to walk, so the FrozenDAG is
+        searched unless the hint contains the point.
+        :param x:
+        :param y:
+        :param hint: a trapezoid of the map, None to search the DAG directly
+        :param max_steps: number of trapezoids the walk may visit
+        :return: the trapezoid containing (x, y)
+        """
+        if self.is_compacted:
+            trapezoids = self.frozen.trapezoids
+            if isinstance(hint, FrozenTrapezoid) and 0 <= hint.id < len(trapezoids) \
+                    and trapezoids[hint.id] is hint and contains(hint, x, y):
+                return hint
+            return trapezoids[self.frozen.locate(x, y)]
+        if hint is not None and hint in self.T.trapezoids:
+            if contains(hint, x, y):
+                return hint
+            t, _ = walk(hint, x, y, max_steps)
+            if t is not None:
+                return t
+        return self.T.G.locate(x, y).graph_object
+
+    def stream(self, cache_size=4, max_steps=8) -> LocationStream:
+        """
+        Point location for a spatially coherent stream of query points, which
+        remembers its recent results, see LocationStream
+        :param cache_size: number of recent results to check before walking
+        :param max_steps: number of trapezoids the walk may visit before the DAG is searched
+        :return: LocationStream
+        """
+        assert not self.is_compacted, 'a compacted decomposition has no neighbor links to walk'
+        return LocationStream(self, cache_size, max_steps)
+
+    def locate_region(self, x, y):
+        """
+        Locate the region of a polygon or polygon set that contains a point
+        :param x:
+        :param y:
+        :return: region label, None if the point lies outside every region
+        """
+        frozen = self.getFrozenDAG()
+        return self.polygon.region_of(frozen.trapezoids[frozen.locate(x, y)])
+
+    def locate_regions(self, xs, ys) -> list:
+        """
+        Locate the regions of a batch of query points with one search per point
+        :param xs: x-coordinates of the query points
+        :param ys: y-coordinates of the query points
+        :return: list of region labels, None for points outside every region
+        """
+        frozen = self.getFrozenDAG()
+        labels = [self.polygon.region_of(t) for t in frozen.trapezoids]
+        return [labels[i] for i in frozen.locate_many(xs, ys).tolist()]
+
+    def save(self, path):
+        """
+        Write the built decomposition to a binary file. Reopen it with
+        FrozenDAG.load(path) to answer queries without rebuilding.
+        :param path:
+        :return:
+        """
+        self.getFrozenDAG().save(path)
+
+    @property
+    def is_compacted(self) -> bool:
+        return self.T is None
+
+    def nbytes(self) -> int:
+        """
+        Approximate size in bytes of the construction: the DAG nodes, the trapezoids
+        and their storage, and the segments that the polygon does not hold
+        :return:
+        """
+        if self.is_compacted:
+            trapezoids = self.frozen.trapezoids
+            return self.frozen.nbytes() + sys.getsizeof(trapezoids) + sum(map(sys.getsizeof, trapezoids))
+        edges = set(self.polygon.E)
+        extra = set()
+        size = sys.getsizeof(self.depth) + sys.getsizeof(self.endpoints) + sys.getsizeof(self.leaves)
+        for node in self.T.G.nodes():
+            size += sys.getsizeof(node)
+            obj = node.graph_object
+            if isinstance(obj, BaseTrapezoid):
+                if not self.T.uses_store:
+                    # the views of a store only exist while they are used
+                    size += sys.getsizeof(obj)
+                extra.update(s for s in (obj.top, obj.bottom) if s not in edges)
+            elif isinstance(obj, LineSegment) and obj not in edges:
+                extra.add(obj)
+        size += sum(sys.getsizeof(s) for s in extra)
+        store = self.T.trapezoids
+        if self.T.uses_store:
+            size += store.nbytes() + sum(map(sys.getsizeof, (store.nodes, store.free, store.state,
+                                                             store.points, store.point_ids,
+                                                             store.segments, store.segment_ids)))
+        else:
+            size += sys.getsizeof(store)
+        return size
+
+    def compact(self) -> dict:
+        """
+        Replace the construction by its dense, read-only FrozenDAG once the map is
+        built. The trapezoids, their neighbor links and the DAG nodes refer to each
+        other in cycles, which are broken here, so everything is freed right away
+        instead of when the cyclic garbage collector runs. That includes the
+        segments that were deleted from the map but are still on search paths.
+        Afterwards the queries search the FrozenDAG and the map can no longer be
+        changed. getFrozenDAG().trapezoids holds a FrozenTrapezoid for every
+        trapezoid, built once, which the queries return.
+        :return: dict with the approximate bytes before and after compaction, the bytes
+            reclaimed and the number of search nodes before and after
+        """
+        if self.is_compacted:
+            size = self.nbytes()
+            return {'bytes_before': size, 'bytes_after': size, 'bytes_reclaimed': 0,
+                    'nodes_before': len(self.frozen), 'nodes_after': len(self.frozen)}
+        before = self.nbytes()
+        nodes = list(self.T.G.nodes())
+        # renumber the live nodes, trapezoids and segments into records
+        frozen = FrozenDAG.from_root(self.T.G.root)
+        # the trapezoids by id, without the neighbor links and DAG leaves of the map
+        trapezoids = [FrozenTrapezoid(t.left_p, t.right_p, t.top, t.bottom, i)
+                      for i, t in enumerate(frozen.trapezoids)]
+        self.frozen = FrozenDAG(frozen.nodes, frozen.trapezoid_records, frozen.segment_records, trapezoids)
+
+        # break the cycles: nodes and trapezoids, neighbors, and the store and its views
+        for node in nodes:
+            node.left_child = node.right_child = None
+        if self.T.uses_store:
+            # the leaves refer to the store, the rows are released without creating views
+            self.T.trapezoids.clear()
+        else:
+            for t in self.T.trapezoids:
+                t.detach()
+        self.T = None
+        self.depth = {}
+        self.endpoints = {}
+        self.leaves = {}
+
+        after = self.nbytes()
+        return {'bytes_before': before, 'bytes_after': after, 'bytes_reclaimed': before - after,
+                'nodes_before': len(nodes), 'nodes_after': len(self.frozen)}
+
     def computeDecomposition(self):
         """
-        Create a vertical decomposition of a simple polygon
+        Create a vertical decomposition of a simple polygon, with holes, or a set of polygons
+        """
+        if self.max_depth_factor is not None:
+            depth_bound = self.max_depth_factor * math.log(len(self.polygon.E) + 1)
+        else:
+            depth_bound = math.inf
+
+        while True:
+            self.computeBoundingBox()
+            # self.polygon.E = [self.polygon.E[i] for i in [1, 7, 3, 5]] \
+            #                  + [self.polygon.E[i] for i in range(len(self.polygon.E)) if i not in [1, 7, 3, 5]]
+            self.random.shuffle(self.polygon.E)
+            for lineSegment in self.polygon.E:
+                if self.instrumentation is None:
+                    self.insertLinesegment(lineSegment)
+                else:
+                    self.instrumentation.time_insert(self.insertLinesegment, lineSegment)
+                # self.T.visualize()
+                # self.T.visualize_graph()
+
+                # the depth only grows, so give up on this order right away
+                if self.max_depth > depth_bound and self.rebuilds < self.max_rebuilds:
+                    break
+            else:
+                return
+            self.rebuilds += 1
+            self.reset()
+
+    def updateDepth(self, replaced) -> list:
+        """
+        Record the depth of the new leaves below the DAG nodes of replaced trapezoids
+        :param replaced: list of (DAG node, depth of the node)
+        :return: the trapezoids of the new leaves
+        """
+        leaves = {}
+        for node, depth in replaced:
+            stack = [(node, depth)]
+            while stack:
+                node, depth = stack.pop()
+                if node.left_child is None:
+                    # a leaf, which can be reached from several replaced trapezoids
+                    t = node.graph_object
+                    leaves[t] = None
+                    if depth > self.depth.get(t, -1):
+                        self.depth[t] = depth
+                        self.max_depth = max(self.max_depth, depth)
+                else:
+                    stack.append((node.left_child, depth + 1))
+                    stack.append((node.right_child, depth + 1))
+        return list(leaves)
+
+    def insert_segments(self, segments):
+        """
+        Insert line segments into the built decomposition. The segments must lie
+        inside the bounding box and may not cross each other or the segments that
+        are already in the map, but they may share endpoints with them.
+        :param segments: iterable of LineSegments
+        :return: (removed, added), the trapezoids that left the map and the new trapezoids
+            that are in the map after the insertions. The removed trapezoids keep their geometry.
         """
-        self.computeBoundingBox()
-        # self.polygon.E = [self.polygon.E[i] for i in [1, 7, 3, 5]] \
-        #                  + [self.polygon.E[i] for i in range(len(self.polygon.E)) if i not in [1, 7, 3, 5]]
-        random.shuffle(self.polygon.E)
-        for lineSegment in self.polygon.E:
-            self.insertLinesegment(lineSegment)
-            # self.T.visualize()
-            # self.T.visualize_graph()
+        if self.is_compacted:
+            raise ValueError('A compacted decomposition can not be changed')
+        segments = list(segments)
+        bottom_left, top_right = self.bounding_box
+        for line_seg in segments:
+            assert isinstance(line_seg, LineSegment)
+            for point in (line_seg.p, line_seg.q):
+                if not (bottom_left.x < point.x < top_right.x and bottom_left.y < point.y < top_right.y):
+                    raise ValueError('%s lies outside the bounding box of the decomposition' % (line_seg,))
+
+        removed, added = {}, {}
+        for line_seg in segments:
+            if self.instrumentation is None:
+                replaced, new = self.insertLinesegment(line_seg)
+            else:
+                replaced, new = self.instrumentation.time_insert(self.insertLinesegment, line_seg)
+            self.polygon.E.append(line_seg)
+
+            for t in replaced:
+                if t in added:
+                    # created by an earlier segment of this batch, so no change
+                    del added[t]
+                else:
+                    removed[t] = None
+            added.update(dict.fromkeys(new))
+        return list(removed), list(added)
+
+    def delete_segment(self, line_seg):
+        """
+        Remove a line segment from the built decomposition. The trapezoids above and
+        below the segment are replaced by the trapezoids of the strip between their
+        other boundaries, cut by the walls that bounded them. Only the DAG leaves
+        of the replaced trapezoids change: each becomes a small search tree over
+        the new trapezoids it overlaps, or a leaf of the only one it overlaps.
+        :param line_seg: a segment in the map
+        :return: (removed, added), the trapezoids that left the map and the new trapezoids.
+            The removed trapezoids keep their geometry.
+        """
+        assert isinstance(line_seg, LineSegment)
+        if self.is_compacted:
+            raise ValueError('A compacted decomposition can not be changed')
+        self.frozen = None
+        above = self.getChainAlong(line_seg, True)
+        below = self.getChainAlong(line_seg, False)
+        p, q = line_seg.p, line_seg.q
+
+        # endpoints that no other segment ends in lose their walls
+        # and the trapezoids beyond them join the strip
+        left, right = [], []
+        for point in (p, q):
+            self.endpoints[point] -= 1
+            if not self.endpoints[point]:
+                del self.endpoints[point]
+        if p not in self.endpoints and above[0].upper_left is not None and above[0].upper_left.right_p == p:
+            left = [above[0].upper_left]
+        if q not in self.endpoints and above[-1].upper_right is not None and above[-1].upper_right.left_p == q:
+            right = [above[-1].upper_right]
+        tops = left + above + right
+        bottoms = left + below + right
+        region = tops + below
+
+        # the walls of the strip, in the lexicographic order of their points
+        points = {w for t in region for w in (t.left_p, t.right_p)}
+        if left:
+            points.discard(p)
+        if right:
+            points.discard(q)
+        walls = sorted(points, key=lex)
+
+        # the strip trapezoids and the old trapezoids that bound them from above and below at their
+        # left and right walls, which differ where the wall of a freed endpoint has gone
+        strip, strip_tops, strip_bottoms = [], [], []
+        i = j = 0
+        for a, b in zip(walls, walls[1:]):
+            while lex(tops[i].right_p) <= lex(a):
+                i += 1
+            while lex(bottoms[j].right_p) <= lex(a):
+                j += 1
+            strip.append(self.T.newTrapezoid(a, b, tops[i].top, bottoms[j].bottom))
+            last_top, last_bottom = i, j
+            while lex(tops[last_top].right_p) < lex(b):
+                last_top += 1
+            while lex(bottoms[last_bottom].right_p) < lex(b):
+                last_bottom += 1
+            strip_tops.append((tops[i], tops[last_top]))
+            strip_bottoms.append((bottoms[j], bottoms[last_bottom]))
+
+        region_set = set(region)
+
+        def across(old, neighbor, t, inside, left):
+            # the neighbor of the old trapezoid beyond a wall becomes the neighbor of t,
+            # or the strip trapezoid on the other side if it is part of the strip itself
+            if neighbor is None or neighbor in region_set:
+                return inside if neighbor is not None else None
+            if left:
+                neighbor.replaceRightNeighbor(old, t, t)
+            else:
+                neighbor.replaceLeftNeighbor(old, t, t)
+            return neighbor
+
+        # a strip trapezoid shares its top (bottom) with the strip trapezoid next to it, unless an
+        # old trapezoid of the top (bottom) chain ends at the wall in between
+        for k, t in enumerate(strip):
+            (left_top, right_top), (left_bottom, right_bottom) = strip_tops[k], strip_bottoms[k]
+            before = strip[k - 1] if k > 0 else None
+            after = strip[k + 1] if k + 1 < len(strip) else None
+            a, b = t.left_p, t.right_p
+            t.upper_left = across(left_top, left_top.upper_left, t, before, True) \
+                if left_top.left_p == a else before
+            t.lower_left = across(left_bottom, left_bottom.lower_left, t, before, True) \
+                if left_bottom.left_p == a else before
+            t.upper_right = across(right_top, right_top.upper_right, t, after, False) \
+                if right_top.right_p == b else after
+            t.lower_right = across(right_bottom, right_bottom.lower_right, t, after, False) \
+                if right_bottom.right_p == b else after
+
+        # every old leaf searches the new trapezoids that overlap it, or leads to the only one it overlaps
+        keys = [lex(w) for w in walls]
+        replaced, spans = [], []
+        for t in region:
+            first = min(max(0, bisect_right(keys, lex(t.left_p)) - 1), len(strip) - 1)
+            last = min(max(first, bisect_left(keys, lex(t.right_p)) - 1), len(strip) - 1)
+            replaced.append((t.node, self.depth.pop(t, 0)))
+            spans.append((t, first, last))
+        # the leaves are reused before the search trees refer to the leaves of the strip
+        adopted = set()
+        for t, first, last in spans:
+            if first == last:
+                self.reuseLeaves(t, strip[first], adopted)
+        for t, first, last in spans:
+            if first < last:
+                self.replaceLeaves(t, self.buildXTree(strip[first:last + 1]))
+
+        self.T.deleteTrapezoidFromMap(region_set)
+        self.T.addTrapezoid(set(strip))
+        self.polygon.E.remove(line_seg)
+        return region, self.updateDepth(replaced)
+
+    def getChainAlong(self, line_seg, above) -> list:
+        """
+        The trapezoids directly above or below a segment of the map, from left to right
+        :param line_seg:
+        :param above: True for the trapezoids with line_seg as bottom, False for those with it as top
+        :return: list of trapezoids
+        """
+        # search the point just right of p on the segment, on the requested side
+        node = self.T.G.root
+        while node.left_child is not None:
+            key = node.graph_object
+            if isinstance(key, Point):
+                go_right = lex(line_seg.p) >= lex(key)
+            elif key == line_seg:
+                go_right = above
+            else:
+                side = key.side_of(line_seg.p.x, line_seg.p.y) or key.side_of(line_seg.q.x, line_seg.q.y)
+                go_right = side >= 0
+            node = node.right_child if go_right else node.left_child
+
+        chain = [node.graph_object]
+        while (chain[-1].bottom if above else chain[-1].top) == line_seg and lex(chain[-1].right_p) < lex(line_seg.q):
+            # the next trapezoid shares the segment
+            chain.append(chain[-1].lower_right if above else chain[-1].upper_right)
+            if chain[-1] is None:
+                break
+        if chain[-1] is None or (chain[-1].bottom if above else chain[-1].top) != line_seg:
+            raise ValueError('%s is not a segment of the decomposition' % (line_seg,))
+        return chain
+
+    def replaceLeaves(self, t, node):
+        """
+        Turn the DAG leaves of a trapezoid that leaves the map into node
+        :param t: the trapezoid
+        :param node: root of the search structure over the trapezoids that replace t
+        :return:
+        """
+        t.node = node
+        for leaf in self.leaves.pop(t, ()):
+            leaf.modify(node)
+
+    def reuseLeaves(self, t, new, adopted):
+        """
+        Let the DAG leaves of a trapezoid that leaves the map lead to the only new
+        trapezoid that overlaps it, instead of putting a node in between. The first
+        such leaf becomes the node of the new trapezoid, later ones are kept in
+        self.leaves and are replaced together with it.
+        :param t: the trapezoid that leaves the map
+        :param new: the new trapezoid
+        :param adopted: the new trapezoids that already took the leaf of another trapezoid
+        :return:
+        """
+        leaves = self.leaves.pop(t, [])
+        if new in adopted:
+            leaves.append(t.node)
+        else:
+            new.adopt(t.node)
+            adopted.add(new)
+        for leaf in leaves:
+            leaf.graph_object = new
+        if leaves:
+            self.leaves.setdefault(new, []).extend(leaves)
+
+    @staticmethod
+    def buildXTree(trapezoids) -> DAGNode:
+        """
+        Balanced tree of X-nodes on the walls between consecutive trapezoids
+        :param trapezoids: trapezoids ordered from left to right
+        :return: root DAGNode
+        """
+        if len(trapezoids) == 1:
+            return trapezoids[0].node
+        mid = len(trapezoids) // 2
+        return DAGNode(trapezoids[mid].left_p, RandomizedIncrementalConstruction.buildXTree(trapezoids[:mid]),
+                       RandomizedIncrementalConstruction.buildXTree(trapezoids[mid:]))
 
     def getIntersectingTrapezoids(self, line_seg):
         """
@@ -35,282 +530,184 @@ class RandomizedIncrementalConstruction:
         :return: list of trapezoids
         """
         assert isinstance(line_seg, LineSegment)
-        p = self.T.G.root.getQueryResult(line_seg.p, line_seg)
-        q = self.T.G.root.getQueryResult(line_seg.q, line_seg)
+        stats = self.instrumentation
+        p = self.T.G.root.getQueryResult(line_seg.p, line_seg, stats=stats)
+        q = self.T.G.root.getQueryResult(line_seg.q, line_seg, stats=stats)
         current_trapezoid = p[0].graph_object
         intersecting_trapezoids = [current_trapezoid]
-        print('Line Segment |', line_seg)
-
-        while current_trapezoid != q[0].graph_object:
-            # print('Inside loop')
-            for n in current_trapezoid.right_neighbors:
-                if current_trapezoid.right_p != n.left_p:
-                    l = LineSegment(current_trapezoid.right_p, n.left_p)
-                else:
-                    if n.left_p == n.bottom.p:
-                        l = n.top
-                        y = l.slope * n.left_p.x + l.intercept
-                        l = LineSegment(n.left_p, Point(n.left_p.x, y))
-                    elif n.left_p == n.top.p:
-                        l = n.bottom
-                        y = l.slope * n.left_p.x + l.intercept
-                        l = LineSegment(Point(n.left_p.x, y), n.left_p)
-                    else:
-                        l = n.bottom
-                        bottom_y = l.slope * n.left_p.x + l.intercept
-                        l = n.top
-                        top_y = l.slope * n.left_p.x + l.intercept
-                        l = LineSegment(Point(n.left_p.x, bottom_y), Point(n.left_p.x, top_y))
-
-                if l.intersects(line_seg):
-                    intersecting_trapezoids.append(n)
-                    current_trapezoid = n
-                    break
-
+        if stats is not None and stats.trace is not None:
+            stats.trace('Line Segment | %s' % (line_seg,))
+
+        q_trapezoid = q[0].graph_object
+        while current_trapezoid is not q_trapezoid:
+            # the segment leaves the trapezoid through its right wall. If right_p lies
+            # above (or on) the segment, continue in the lower right neighbor, else in the upper one
+            right_p = current_trapezoid.right_p
+            if line_seg.side_of(right_p.x, right_p.y) >= 0:
+                next_trapezoid = current_trapezoid.lower_right
+            else:
+                next_trapezoid = current_trapezoid.upper_right
+            if next_trapezoid is None:
+                raise ValueError('Walk along %s left the trapezoidal map at %s' % (line_seg, current_trapezoid))
+            current_trapezoid = next_trapezoid
+            intersecting_trapezoids.append(current_trapezoid)
+
+        if stats is not None:
+            stats.trapezoids_walked += len(intersecting_trapezoids)
         return intersecting_trapezoids, p, q
 
     def insertLinesegment(self, line_seg):
+        """
+        Insert a single line segment into the map and the DAG
+        :param line_seg:
+        :return: the trapezoids intersected by the segment, which were replaced but keep
+            their geometry, and the new trapezoids that replace them
+        """
         assert isinstance(line_seg, LineSegment)
-
-        # Special case for vertical line segments: just ignore them
-        if line_seg.isVertical:
-            return
-
-        # find the trapezoid in which p and q lie
-        intersectingTrapezoids, (pNode, p_exists), (qNode, q_exists) = self.getIntersectingTrapezoids(line_seg)
-        pTrapezoid, qTrapezoid = pNode.graph_object, qNode.graph_object
-
-        # p and q lie in the same trapezoid
-        if len(intersectingTrapezoids) == 1:
-            # we always need to split the trapezoid
-            newTopTrapezoid = Trapezoid(line_seg.p, line_seg.q, pTrapezoid.top, line_seg)
-            newBottomTrapezoid = Trapezoid(line_seg.p, line_seg.q, line_seg, pTrapezoid.bottom)
-
-            # make a DAG y-node for these trapezoids with the line segment
-            yNode = DAGNode(line_seg, newBottomTrapezoid.node, newTopTrapezoid.node)
-
-            if q_exists:
-                newBottomTrapezoid.setRightNeighbors(pTrapezoid.right_neighbors)
-                # for neighbor in newBottomTrapezoid.right_neighbors:
-                #     neighbor.left_neighbors.discard(pTrapezoid)
-
-                newTopTrapezoid.setRightNeighbors(pTrapezoid.right_neighbors)
-                # for neighbor in newTopTrapezoid.right_neighbors:
-                #     neighbor.left_neighbors.discard(pTrapezoid)
+        self.frozen = None
+
+        # find the trapezoids intersected by the segment, from left to right
+        intersectingTrapezoids, _, _ = self.getIntersectingTrapezoids(line_seg)
+        replaced = [(t.node, self.depth.pop(t, 0)) for t in intersectingTrapezoids]
+        for point in (line_seg.p, line_seg.q):
+            self.endpoints[point] = self.endpoints.get(point, 0) + 1
+        p, q = line_seg.p, line_seg.q
+        first, last = intersectingTrapezoids[0], intersectingTrapezoids[-1]
+
+        # the new trapezoids above and below the segment
+        tops = self.splitChain(line_seg, intersectingTrapezoids, True)
+        bottoms = self.splitChain(line_seg, intersectingTrapezoids, False)
+        new = set(tops) | set(bottoms)
+
+        # the left end: a trapezoid left of p, unless p is the wall of the first trapezoid already
+        leftTrapezoid = None
+        if first.left_p == p:
+            tops[0].upper_left = first.upper_left
+            bottoms[0].lower_left = first.lower_left
+            for n in first.left_neighbors:
+                n.replaceRightNeighbor(first, tops[0], bottoms[0])
+        else:
+            leftTrapezoid = self.T.newTrapezoid(first.left_p, p, first.top, first.bottom)
+            leftTrapezoid.upper_left, leftTrapezoid.lower_left = first.upper_left, first.lower_left
+            for n in first.left_neighbors:
+                n.replaceRightNeighbor(first, leftTrapezoid, leftTrapezoid)
+            leftTrapezoid.upper_right, leftTrapezoid.lower_right = tops[0], bottoms[0]
+            tops[0].upper_left = bottoms[0].lower_left = leftTrapezoid
+            new.add(leftTrapezoid)
+
+        # the right end: a trapezoid right of q, unless q is the wall of the last trapezoid already
+        rightTrapezoid = None
+        if last.right_p == q:
+            tops[-1].upper_right = last.upper_right
+            bottoms[-1].lower_right = last.lower_right
+            for n in last.right_neighbors:
+                n.replaceLeftNeighbor(last, tops[-1], bottoms[-1])
+        else:
+            rightTrapezoid = self.T.newTrapezoid(q, last.right_p, last.top, last.bottom)
+            rightTrapezoid.upper_right, rightTrapezoid.lower_right = last.upper_right, last.lower_right
+            for n in last.right_neighbors:
+                n.replaceLeftNeighbor(last, rightTrapezoid, rightTrapezoid)
+            rightTrapezoid.upper_left, rightTrapezoid.lower_left = tops[-1], bottoms[-1]
+            tops[-1].upper_right = bottoms[-1].lower_right = rightTrapezoid
+            new.add(rightTrapezoid)
+
+        # Updating the DAG: the leaf of every intersected trapezoid becomes a y-node on the segment,
+        # below x-nodes for the endpoints that lie inside it
+        for i, t in enumerate(intersectingTrapezoids):
+            node = DAGNode(line_seg, bottoms[i].node, tops[i].node)
+            if t is last and rightTrapezoid is not None:
+                node = DAGNode(q, node, rightTrapezoid.node)
+            if t is first and leftTrapezoid is not None:
+                node = DAGNode(p, leftTrapezoid.node, node)
+            self.replaceLeaves(t, node)
+
+        # Updating the trapezoidal map
+        self.T.deleteTrapezoidFromMap(set(intersectingTrapezoids))
+        self.T.addTrapezoid(new)
+
+        return intersectingTrapezoids, self.updateDepth(replaced)
+
+    def splitChain(self, line_seg, trapezoids, above) -> list:
+        """
+        Create the trapezoids on one side of a new segment and link them to each other and to their
+        neighbors on that side. The wall between two consecutive intersected trapezoids is cut by the
+        segment and only continues on the side of its defining point; on the other side the parts of
+        both trapezoids merge into one. The slots at the ends of the segment are set by the caller.
+        :param line_seg: the new segment
+        :param trapezoids: the trapezoids intersected by the segment, from left to right
+        :param above: True for the trapezoids above the segment, False for those below it
+        :return: the new trapezoid covering every intersected trapezoid on this side
+        """
+        # intersected trapezoids that start a new trapezoid on this side
+        starts = [0] + [i for i in range(1, len(trapezoids))
+                        if (line_seg.side_of(trapezoids[i].left_p.x, trapezoids[i].left_p.y) >= 0) == above]
+        ends = starts[1:] + [len(trapezoids)]
+        if self.instrumentation is not None:
+            self.instrumentation.trapezoids_merged += len(trapezoids) - len(starts)
+
+        parts = []
+        previous = None
+        for a, b in zip(starts, ends):
+            left_p = line_seg.p if a == 0 else trapezoids[a].left_p
+            right_p = line_seg.q if b == len(trapezoids) else trapezoids[b - 1].right_p
+            if above:
+                t = self.T.newTrapezoid(left_p, right_p, trapezoids[a].top, line_seg)
             else:
-                # make a trapezoid right of q
-                if line_seg.q.x == pTrapezoid.right_p.x \
-                        and any(len(neighbor.left_neighbors) >= 2 for neighbor in pTrapezoid.right_neighbors):
-                    rightTrapezoid = Trapezoid(Point(line_seg.q.x, pTrapezoid.top.q.y),
-                                               Point(line_seg.q.x, pTrapezoid.bottom.q.y),
-                                               pTrapezoid.top, pTrapezoid.bottom)
+                t = self.T.newTrapezoid(left_p, right_p, line_seg, trapezoids[a].bottom)
+
+            if previous is not None:
+                # the wall at left_p: the new trapezoids share the segment, and the old trapezoids
+                # on either side of the wall link to what lies beyond it on this side
+                before, after = trapezoids[a - 1], trapezoids[a]
+                if above:
+                    t.lower_left, previous.lower_right = previous, t
+                    outer_left, outer_right = after.upper_left, before.upper_right
                 else:
-                    rightTrapezoid = Trapezoid(line_seg.q, pTrapezoid.right_p, pTrapezoid.top, pTrapezoid.bottom)
-                rightTrapezoid.setLeftNeighbors({newBottomTrapezoid, newTopTrapezoid})
-                rightTrapezoid.setRightNeighbors(pTrapezoid.right_neighbors)
-
-                # update right neighbors of containing trapezoid
-                # for neighbor in rightTrapezoid.right_neighbors:
-                #     neighbor.left_neighbors.discard(pTrapezoid)
-
-                self.T.addTrapezoid({rightTrapezoid})
-                qXnode = DAGNode(line_seg.q, yNode, rightTrapezoid.node)
-                # change the pNode to the new qXnode
-                if p_exists:
-                    pNode.modify(qXnode)
-
-            if p_exists:
-                newBottomTrapezoid.setLeftNeighbors(pTrapezoid.left_neighbors)
-                # for neighbor in newBottomTrapezoid.left_neighbors:
-                #     neighbor.right_neighbors.discard(pTrapezoid)
-
-                newTopTrapezoid.setLeftNeighbors(pTrapezoid.left_neighbors)
-                # for neighbor in newTopTrapezoid.left_neighbors:
-                #     neighbor.right_neighbors.discard(pTrapezoid)
-            else:
-                # make a trapezoid left of p
-                if line_seg.p.x == pTrapezoid.left_p.x \
-                        and any(len(neighbor.right_neighbors) >= 2 for neighbor in pTrapezoid.left_neighbors):
-                    leftTrapezoid = Trapezoid(Point(line_seg.p.x, pTrapezoid.top.p.y),
-                                              Point(line_seg.p.x, pTrapezoid.bottom.p.y),
-                                              pTrapezoid.top, pTrapezoid.bottom)
+                    t.upper_left, previous.upper_right = previous, t
+                    outer_left, outer_right = after.lower_left, before.lower_right
+                if outer_left is before:
+                    outer_left = previous
+                elif outer_left is not None:
+                    outer_left.replaceRightNeighbor(after, t, t)
+                if outer_right is after:
+                    outer_right = t
+                elif outer_right is not None:
+                    outer_right.replaceLeftNeighbor(before, previous, previous)
+                if above:
+                    t.upper_left, previous.upper_right = outer_left, outer_right
                 else:
-                    leftTrapezoid = Trapezoid(pTrapezoid.left_p, line_seg.p, pTrapezoid.top, pTrapezoid.bottom)
-                leftTrapezoid.setLeftNeighbors(pTrapezoid.left_neighbors)
-                leftTrapezoid.setRightNeighbors({newBottomTrapezoid, newTopTrapezoid})
-
-                # update left neighbors of containing trapezoid
-                # for neighbor in leftTrapezoid.left_neighbors:
-                #     neighbor.right_neighbors.discard(pTrapezoid)
-
-                self.T.addTrapezoid({leftTrapezoid})
-                pXnode = DAGNode(line_seg.p,
-                                 leftTrapezoid.node,
-                                 qXnode if not q_exists else yNode)
-                pNode.modify(pXnode)
-
-            if q_exists and p_exists:
-                pNode.modify(yNode)
-
-            # Update the trapezoidal map
-            self.T.deleteTrapezoidFromMap({pTrapezoid})
-            self.T.addTrapezoid({newTopTrapezoid, newBottomTrapezoid})
-
-        elif len(intersectingTrapezoids) > 1:
-            """ https://isotropic.org/papers/point-location.pdf """
-            # Handle the trapezoid containing lineSegment.p
-            # newLeftBottomTrapezoid = Trapezoid(lineSegment.p, lineSegment.get_Y(pTrapezoid.right_p.x),
-            #                                    lineSegment, pTrapezoid.bottom)
-            newLeftBottomTrapezoid = Trapezoid(line_seg.p, pTrapezoid.right_p, line_seg, pTrapezoid.bottom)
-            newLeftBottomTrapezoid.setRightNeighbors(
-                {n for n in pTrapezoid.right_neighbors if not line_seg.aboveLine(n.top.q)})
-
-            # newLeftTopTrapezoid = Trapezoid(lineSegment.p, lineSegment.get_Y(pTrapezoid.right_p.x),
-            #                                 pTrapezoid.top, lineSegment)
-            newLeftTopTrapezoid = Trapezoid(line_seg.p, pTrapezoid.right_p, pTrapezoid.top, line_seg)
-            newLeftTopTrapezoid.setRightNeighbors(
-                {n for n in pTrapezoid.right_neighbors if line_seg.aboveLine(n.bottom.q)})
-
-            if not p_exists:
-                newLeftTrapezoid = Trapezoid(pTrapezoid.left_p, line_seg.p, pTrapezoid.top, pTrapezoid.bottom)
-                newLeftTrapezoid.setLeftNeighbors(pTrapezoid.left_neighbors)
-                newLeftTrapezoid.setRightNeighbors({newLeftTopTrapezoid, newLeftBottomTrapezoid})
-            else:
-                newLeftTopTrapezoid.setLeftNeighbors(pTrapezoid.left_neighbors)
-                newLeftBottomTrapezoid.setLeftNeighbors(pTrapezoid.left_neighbors)
-
-            # Handle the trapezoid containing lineSegment.q
-            # newRightBottomTrapezoid = Trapezoid(lineSegment.get_Y(qTrapezoid.left_p.x), lineSegment.q,
-            #                                     lineSegment, qTrapezoid.bottom)
-            newRightBottomTrapezoid = Trapezoid(qTrapezoid.left_p, line_seg.q, line_seg, qTrapezoid.bottom)
-
-            newRightBottomTrapezoid.setLeftNeighbors(
-                {n for n in qTrapezoid.left_neighbors if not line_seg.aboveLine(n.top.q)})
-            # newRightTopTrapezoid = Trapezoid(lineSegment.get_Y(qTrapezoid.left_p.x), lineSegment.q,
-            #                                  qTrapezoid.top, lineSegment)
-            newRightTopTrapezoid = Trapezoid(qTrapezoid.left_p, line_seg.q, qTrapezoid.top, line_seg)
-            newRightTopTrapezoid.setLeftNeighbors(
-                {n for n in qTrapezoid.left_neighbors if line_seg.aboveLine(n.bottom.q)})
-
-            if not q_exists:
-                newRightTrapezoid = Trapezoid(line_seg.q, qTrapezoid.right_p, qTrapezoid.top, qTrapezoid.bottom)
-                newRightTrapezoid.setLeftNeighbors({newRightTopTrapezoid, newRightBottomTrapezoid})
-                newRightTrapezoid.setRightNeighbors(qTrapezoid.right_neighbors)
-            else:
-                newRightTopTrapezoid.setRightNeighbors(qTrapezoid.right_neighbors)
-                newRightBottomTrapezoid.setRightNeighbors(qTrapezoid.right_neighbors)
-
-            # Walk to the right along the new segment and split
-            # each trapezoid into upper and lower ones
-            newTopTrapezoids, newBottomTrapezoids = [newLeftTopTrapezoid], [newLeftBottomTrapezoid]
-            trap_dict = dict()
-            trap_dict[pTrapezoid] = (newLeftTopTrapezoid, newLeftBottomTrapezoid)
-            for t in intersectingTrapezoids[1:-1]:
-                # create new top and bottom trapezoids
-                # new_top = Trapezoid(lineSegment.get_Y(t.left_p.x), lineSegment.get_Y(t.right_p.x),
-                #                     t.top, lineSegment)
-                # new_bottom = Trapezoid(lineSegment.get_Y(t.left_p.x), lineSegment.get_Y(t.right_p.x),
-                #                        lineSegment, t.bottom)
-                new_top = Trapezoid(t.left_p, t.right_p, t.top, line_seg)
-                new_bottom = Trapezoid(t.left_p, t.right_p, line_seg, t.bottom)
-
-                # Update neighbors of the new top and bottom
-                for n in t.left_neighbors:
-                    if line_seg.aboveLine(n.bottom.q):
-                        new_top.setLeftNeighbors({n})
-                    if not line_seg.aboveLine(n.top.q):
-                        new_bottom.setLeftNeighbors({n})
-                new_top.setLeftNeighbors({newTopTrapezoids[-1]})
-                new_bottom.setLeftNeighbors({newBottomTrapezoids[-1]})
-
-                # Add it to the list and dict
-                newTopTrapezoids.append(new_top)
-                newBottomTrapezoids.append(new_bottom)
-                trap_dict[t] = (new_top, new_bottom)
-
-            newRightTopTrapezoid.setLeftNeighbors({newTopTrapezoids[-1]})
-            newRightBottomTrapezoid.setLeftNeighbors({newBottomTrapezoids[-1]})
-            newTopTrapezoids.append(newRightTopTrapezoid)
-            newBottomTrapezoids.append(newRightBottomTrapezoid)
-            trap_dict[qTrapezoid] = (newRightTopTrapezoid, newRightBottomTrapezoid)
-
-            # Merge trapezoids with the same top and bottom line segments
-            for k, g in groupby(newTopTrapezoids, lambda x: x.top):
-                g = list(g)
-                if len(g) > 1:
-                    # create new merged trapezoid
-                    t = Trapezoid(g[0].left_p, g[-1].right_p, k, g[0].bottom)
-                    for n in g[0].left_neighbors:
-                        n.right_neighbors.discard(g[0])
-                    for n in g[-1].right_neighbors:
-                        n.left_neighbors.discard(g[-1])
-                    t.setLeftNeighbors(g[0].left_neighbors)
-                    t.setRightNeighbors(g[-1].right_neighbors)
-
-                    # Update list and dictionary
-                    for k, v in trap_dict.items():
-                        if v[0] in g:
-                            trap_dict[k] = (t, v[1])
-
-            for k, g in groupby(newBottomTrapezoids, lambda x: x.bottom):
-                g = list(g)
-                if len(g) > 1:
-                    # create new merged trapezoid
-                    t = Trapezoid(g[0].left_p, g[-1].right_p, g[0].top, k)
-                    for n in g[0].left_neighbors:
-                        n.right_neighbors.discard(g[0])
-                    for n in g[-1].right_neighbors:
-                        n.left_neighbors.discard(g[-1])
-                    t.setLeftNeighbors(g[0].left_neighbors)
-                    t.setRightNeighbors(g[-1].right_neighbors)
-
-                    # Update list and dictionary
-                    for k, v in trap_dict.items():
-                        if v[1] in g:
-                            trap_dict[k] = (v[0], t)
-
-            # Updating the DAG and the Trapezoidal map
-            if not p_exists:
-                pTrapezoid.node = DAGNode(line_seg.p,
-                                          left_child=newLeftTrapezoid.node,
-                                          right_child=DAGNode(line_seg, trap_dict[pTrapezoid][1].node,
-                                                              trap_dict[pTrapezoid][0].node))
-                self.T.deleteTrapezoidFromMap({pTrapezoid})
-                self.T.addTrapezoid({newLeftTrapezoid})
-            if not q_exists:
-                qTrapezoid.node = DAGNode(line_seg.q,
-                                          left_child=DAGNode(line_seg, trap_dict[qTrapezoid][1].node,
-                                                             trap_dict[qTrapezoid][0].node),
-                                          right_child=newRightTrapezoid.node)
-                self.T.deleteTrapezoidFromMap({qTrapezoid})
-                self.T.addTrapezoid({newRightTrapezoid})
-            for t in intersectingTrapezoids[0 if p_exists else 1: len(intersectingTrapezoids) if q_exists else -1]:
-                t.node = DAGNode(line_seg, left_child=trap_dict[t][1].node, right_child=trap_dict[t][0].node)
-            self.T.deleteTrapezoidFromMap(set(intersectingTrapezoids))
-            self.T.addTrapezoid({v[0] for v in trap_dict.values()})
-            self.T.addTrapezoid({v[1] for v in trap_dict.values()})
+                    t.lower_left, previous.lower_right = outer_left, outer_right
+
+            parts.extend([t] * (b - a))
+            previous = t
+        return parts
 
     def computeBoundingBox(self):
         # find  top right point to create a bounding box (bottom left is [0, 0])
-        topRight = Point(0, 0)
-        bottomLeft = Point(float("inf"), float("inf"))
-
-        for point in self.polygon.V:
-            # find top right
-            if point.get_x() >= topRight.get_x():
-                topRight.set_x(point.get_x() + 1)
-            if point.get_y() >= topRight.get_y():
-                topRight.set_y(point.get_y() + 1)
-
-            # find left bottom
-            if point.get_x() <= bottomLeft.get_x():
-                bottomLeft.set_x(point.get_x() - 1)
-            if point.get_y() <= bottomLeft.get_y():
-                bottomLeft.set_y(point.get_y() - 1)
+        x_s = [point.x for point in self.polygon.V]
+        y_s = [point.y for point in self.polygon.V]
+        topRight = Point(max(x_s) + 1, max(y_s) + 1)
+        bottomLeft = Point(min(x_s) - 1, min(y_s) - 1)
+        self.bounding_box = bottomLeft, topRight
 
         # Now add the bounding box as a trapezoid
-        B = Trapezoid(bottomLeft, topRight,
-                      LineSegment(Point(bottomLeft.x, topRight.y), topRight),
-                      LineSegment(bottomLeft, Point(topRight.x, bottomLeft.y)))
+        B = self.T.newTrapezoid(bottomLeft, topRight,
+                                LineSegment(Point(bottomLeft.x, topRight.y), topRight),
+                                LineSegment(bottomLeft, Point(topRight.x, bottomLeft.y)))
         self.T.addTrapezoid({B})
-        self.T.G = DAG(DAGNode(B))
+        self.T.G = DAG(B.node)
+        self.depth[B] = 0
+
+
+def lex(point) -> tuple:
+    """
+    Sort key of a point in the symbolically sheared plane, where points are ordered by x and then by y
+    """
+    return point.x, point.y
+
+
+def build_depth(polygon, seed, kwargs):
+    """
+    Longest search path of a seeded build, run in the worker processes of best_of
+    """
+    return RandomizedIncrementalConstruction(polygon, seed=seed, **kwargs).max_depth
@@ -0,0 +1,94 @@
+from LineSegment import LineSegment
+from SweepStatus import SweepStatus
+
+
+def touches(s, t) -> bool:
+    """
+    Exact check whether two segments have a point in common other than a shared endpoint
+    :param s: LineSegment
+    :param t: LineSegment
+    :return:
+    """
+    if s == t:
+        return True
+    shared = {s.p, s.q} & {t.p, t.q}
+    if shared:
+        # segments with a common endpoint only overlap if they are collinear and go the same way
+        c = shared.pop()
+        u = s.q if s.p == c else s.p
+        v = t.q if t.p == c else t.p
+        return (LineSegment.ccw(s.p, s.q, v) == 0 and LineSegment.on_segment(s.p, v, s.q)) \
+            or (LineSegment.ccw(t.p, t.q, u) == 0 and LineSegment.on_segment(t.p, u, t.q))
+    return s.intersects(t)
+
+
+def find_crossing(segments):
+    """
+    Shamos-Hoey sweep for the first pair of segments that cross, overlap or touch
+    anywhere other than in a shared endpoint, in O(n log n) time.
+
+    The sweep visits the endpoints in lexicographic order and keeps the
+    non-vertical segments that cross the sweep line in a SweepStatus. Only
+    segments that become neighbors in the status are tested against each other,
+    and every event point is tested against the segment directly below it. A
+    vertical segment is tested against the segment directly above its lower
+    endpoint and against the event points that follow it on the same vertical line.
+    :param segments: iterable of LineSegments
+    :return: (s, t), the pair found at the leftmost event point, None if the segments are disjoint
+    """
+    events = {}
+    seen = set()
+    for segment in segments:
+        if segment in seen:
+            return segment, segment
+        seen.add(segment)
+        if segment.isVertical:
+            events.setdefault(segment.p, ([], [], [], []))[2].append(segment)
+            events.setdefault(segment.q, ([], [], [], []))[3].append(segment)
+        else:
+            events.setdefault(segment.p, ([], [], [], []))[1].append(segment)
+            events.setdefault(segment.q, ([], [], [], []))[0].append(segment)
+
+    status = SweepStatus()
+    # the vertical segment that the sweep is moving up along
+    vertical = None
+    for point in sorted(events, key=lambda p: (p.x, p.y)):
+        ending, starting, verticals, tops = events[point]
+        incident = ending + starting + verticals + tops
+        if vertical is not None:
+            if vertical.q.x == point.x and point.y < vertical.q.y:
+                return vertical, incident[0]
+            if vertical.q.x != point.x or vertical.q.y == point.y:
+                vertical = None
+
+        for segment in ending:
+            status.remove(segment)
+        below, above = status.locate(point)
+        if below is not None and below.side_of(point.x, point.y) == 0:
+            # the point lies inside a segment that does not end in it
+            return below, incident[0]
+
+        # test the gaps that open around the point
+        for segment in starting:
+            status.insert(segment, point.x)
+        neighbors = [below]
+        if below is not None:
+            segment = status.succ(below)
+        else:
+            segment = status.first().segment if len(status) else None
+        while segment is not above:
+            neighbors.append(segment)
+            segment = status.succ(segment)
+        neighbors.append(above)
+        for s, t in zip(neighbors, neighbors[1:]):
+            if s is not None and t is not None and touches(s, t):
+                return s, t
+
+        if verticals:
+            if len(verticals) > 1:
+                return verticals[0], verticals[1]
+            vertical = verticals[0]
+            if above is not None and above.side_of(vertical.q.x, vertical.q.y) > 0:
+                # the segment above the lower endpoint passes below the upper endpoint
+                return above, vertical
+    return None
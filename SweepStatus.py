@@ -0,0 +1,252 @@
+import random
+
+from LineSegment import LineSegment
+from Predicates import compare_slopes
+
+# relative error of the float heights of two segments at the sweep line, larger
+# differences are trusted and smaller ones are decided by the exact predicates
+HEIGHT_TOLERANCE = 2.0 ** -40
+
+
+class StatusNode:
+    """
+    Node of the sweep status treap, every segment in the status has its own node
+    """
+
+    __slots__ = ('segment', 'priority', 'left', 'right', 'parent')
+
+    def __init__(self, segment, priority):
+        self.segment = segment
+        self.priority = priority
+        self.left = None
+        self.right = None
+        self.parent = None
+
+
+class SweepStatus:
+    """
+    Status structure of a line sweep: the segments that cross the sweep line,
+    ordered from bottom to top. Vertical segments are not compared, they are
+    inserted at their place with insert_below.
+
+    The segments are kept in a treap, a binary search tree that is balanced in
+    expectation by random priorities. Segments are only compared when one is
+    inserted, by their heights at the x-coordinate of the sweep line, which are
+    computed from the slope and intercept cached in every LineSegment. Every
+    segment keeps its own node, so removal and the predecessor and successor
+    queries follow the tree links and never compare segments. All operations
+    take O(log n) expected time.
+    """
+
+    def __init__(self, seed=0):
+        self.root = None
+        self.nodes = {}
+        self.random = random.Random(seed)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, segment):
+        return segment in self.nodes
+
+    def __iter__(self):
+        """
+        The segments from bottom to top
+        """
+        node = self.first()
+        while node is not None:
+            yield node.segment
+            node = successor(node)
+
+    def first(self):
+        """
+        The node of the lowest segment, None if the status is empty
+        """
+        node = self.root
+        if node is None:
+            return None
+        while node.left is not None:
+            node = node.left
+        return node
+
+    def locate(self, point):
+        """
+        The segments directly below and above a point that does not lie on a segment
+        in the status. Points on a segment count as above it.
+        :param point: Point
+        :return: (below, above), None if there is no such segment
+        """
+        below, above = None, None
+        node = self.root
+        while node is not None:
+            if node.segment.side_of(point.x, point.y) >= 0:
+                below, node = node.segment, node.right
+            else:
+                above, node = node.segment, node.left
+        return below, above
+
+    def insert(self, segment, x):
+        """
+        Insert a segment that crosses the sweep line at x. Segments that meet the
+        new segment at x are ordered by their slopes, i.e. by their order just
+        right of the sweep line.
+        :param segment: non-vertical LineSegment
+        :param x: x-coordinate of the sweep line
+        :return:
+        """
+        assert isinstance(segment, LineSegment) and not segment.isVertical
+        if segment in self.nodes:
+            # like inserting an existing key into a search tree, the order does not change
+            return
+        parent, node, below = None, self.root, False
+        while node is not None:
+            parent = node
+            below = compare(segment, node.segment, x) < 0
+            node = node.left if below else node.right
+        self.attach(segment, parent, below)
+
+    def insert_below(self, segment, above):
+        """
+        Insert a segment directly below a segment in the status, without comparing it to
+        other segments. In the symbolically sheared plane a vertical segment lies directly
+        below the segment above its lower endpoint, and ends before the next event point.
+        :param segment: LineSegment that is not in the status
+        :param above: a segment in the status
+        :return:
+        """
+        assert isinstance(segment, LineSegment) and segment not in self.nodes
+        # the new node becomes the predecessor of the node of above
+        parent, below = self.nodes[above], True
+        if parent.left is not None:
+            parent, below = parent.left, False
+            while parent.right is not None:
+                parent = parent.right
+        self.attach(segment, parent, below)
+
+    def attach(self, segment, parent, below):
+        """
+        Add the node of a new segment as a leaf below parent and restore the heap order
+        :param segment:
+        :param parent: StatusNode, None if the status is empty
+        :param below: True to make the node the left child of parent, False for the right child
+        :return:
+        """
+        new = StatusNode(segment, self.random.random())
+        self.nodes[segment] = new
+        new.parent = parent
+        if parent is None:
+            self.root = new
+            return
+        if below:
+            parent.left = new
+        else:
+            parent.right = new
+
+        # restore the heap order of the priorities
+        while new.parent is not None and new.parent.priority > new.priority:
+            self.rotate_up(new)
+
+    def remove(self, segment):
+        """
+        Remove a segment from the status
+        :param segment: a segment in the status
+        :return:
+        """
+        node = self.nodes.pop(segment)
+        # rotate the node down until it has at most one child
+        while node.left is not None and node.right is not None:
+            child = node.left if node.left.priority < node.right.priority else node.right
+            self.rotate_up(child)
+        child = node.left if node.left is not None else node.right
+        self.replace(node, child)
+
+    def pred(self, segment):
+        """
+        The segment directly below a segment in the status
+        :return: LineSegment, None if it is the lowest segment
+        """
+        node = predecessor(self.nodes[segment])
+        return None if node is None else node.segment
+
+    def succ(self, segment):
+        """
+        The segment directly above a segment in the status
+        :return: LineSegment, None if it is the highest segment
+        """
+        node = successor(self.nodes[segment])
+        return None if node is None else node.segment
+
+    def rotate_up(self, node):
+        """
+        Rotate a node above its parent, keeping the in-order sequence
+        """
+        parent = node.parent
+        if parent.left is node:
+            parent.left = node.right
+            if node.right is not None:
+                node.right.parent = parent
+            node.right = parent
+        else:
+            parent.right = node.left
+            if node.left is not None:
+                node.left.parent = parent
+            node.left = parent
+        self.replace(parent, node)
+        parent.parent = node
+
+    def replace(self, node, child):
+        """
+        Put child in the place of node below the parent of node
+        """
+        parent = node.parent
+        if child is not None:
+            child.parent = parent
+        if parent is None:
+            self.root = child
+        elif parent.left is node:
+            parent.left = child
+        else:
+            parent.right = child
+
+    def __repr__(self):
+        return '<SweepStatus segments:%d>' % len(self.nodes)
+
+
+def compare(a, b, x) -> int:
+    """
+    Order of two non-vertical segments on the vertical line at x, segments that
+    meet at x are ordered by their slopes
+    :return: 1 if a lies above b, -1 if it lies below b and 0 if they overlap
+    """
+    if a is b:
+        return 0
+    # y = p.y + (x - p.x) * slope, like LineSegment.y_at
+    da, db = (x - a.p.x) * a.slope, (x - b.p.x) * b.slope
+    diff = (a.p.y + da) - (b.p.y + db)
+    if abs(diff) <= HEIGHT_TOLERANCE * (abs(a.p.y) + abs(da) + abs(b.p.y) + abs(db)):
+        diff = a.compare_at(b, x)
+        if diff == 0:
+            diff = compare_slopes(a.p.x, a.p.y, a.q.x, a.q.y, b.p.x, b.p.y, b.q.x, b.q.y)
+    return (diff > 0) - (diff < 0)
+
+
+def predecessor(node):
+    if node.left is not None:
+        node = node.left
+        while node.right is not None:
+            node = node.right
+        return node
+    while node.parent is not None and node.parent.left is node:
+        node = node.parent
+    return node.parent
+
+
+def successor(node):
+    if node.right is not None:
+        node = node.right
+        while node.left is not None:
+            node = node.left
+        return node
+    while node.parent is not None and node.parent.right is node:
+        node = node.parent
+    return node.parent
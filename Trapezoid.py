@@ -7,11 +7,71 @@ import DAGNode as dag
 # from llist import dllistnode
 
 
-class Trapezoid(GraphObject):
+class BaseTrapezoid(GraphObject):
     """
     Class representing a trapezoid with top, bottom, left_p and right_p
     (2 line segments and 2 endpoints respectively)
+
+    A trapezoid has at most two neighbors on each side: the upper neighbor
+    shares its top segment and the lower neighbor shares its bottom segment.
+    Both slots hold the same trapezoid if a single neighbor shares both, and
+    None if there is no such neighbor. The slots are set by the insertion
+    cases of the construction, which know the neighbors of every new trapezoid.
+
+    The base class holds no fields, subclasses provide the fields as slots
+    (Trapezoid) or as columns of a TrapezoidStore (StoredTrapezoid).
+    """
+
+    __slots__ = ()
+
+    @property
+    def is_zero_width(self):
+        return self.left_p.x == self.right_p.x
+
+    @property
+    def left_neighbors(self) -> tuple:
+        """
+        The distinct left neighbors, upper first
+        """
+        return neighbors(self.upper_left, self.lower_left)
+
+    @property
+    def right_neighbors(self) -> tuple:
+        """
+        The distinct right neighbors, upper first
+        """
+        return neighbors(self.upper_right, self.lower_right)
+
+    def replaceLeftNeighbor(self, old, upper, lower):
+        """
+        Replace old in the left slots, the upper slot by upper and the lower slot by lower
+        """
+        if self.upper_left is old:
+            self.upper_left = upper
+        if self.lower_left is old:
+            self.lower_left = lower
+
+    def replaceRightNeighbor(self, old, upper, lower):
+        """
+        Replace old in the right slots, the upper slot by upper and the lower slot by lower
+        """
+        if self.upper_right is old:
+            self.upper_right = upper
+        if self.lower_right is old:
+            self.lower_right = lower
+
+    def __repr__(self):
+        return '<Trapezoid left_p:%s right_p:%s top:%s bottom:%s>' % (str(self.left_p), str(self.right_p),
+                                                                      str(self.top), str(self.bottom))
+
+
+class Trapezoid(BaseTrapezoid):
     """
+    Trapezoid that keeps its fields and its DAG leaf in slots
+    """
+
+    __slots__ = ('left_p', 'right_p', 'top', 'bottom',
+                 'upper_left', 'lower_left', 'upper_right', 'lower_right', '_node')
 
     def __init__(self, left_p, right_p, top, bottom):
         super().__init__()
@@ -22,8 +82,10 @@ class Trapezoid(GraphObject):
         self.right_p = right_p
         self.top = top
         self.bottom = bottom
-        self.left_neighbors = set()
-        self.right_neighbors = set()
+        self.upper_left = None
+        self.lower_left = None
+        self.upper_right = None
+        self.lower_right = None
         self._node = dag.DAGNode(self)
         # self._dllistnode = dllistnode(self)
 
@@ -35,135 +97,50 @@ class Trapezoid(GraphObject):
     def node(self, node):
         self._node.modify(node)
 
-    @property
-    def is_zero_width(self):
-        return self.left_p.x == self.right_p.x
+    def adopt(self, leaf):
+        """
+        Make the DAG leaf of a trapezoid that left the map the leaf of this new trapezoid,
+        whose own leaf is not part of the DAG yet
+        """
+        assert isinstance(leaf, dag.DAGNode) and leaf.left_child is None
+        leaf.graph_object = self
+        self._node = leaf
+
+    def detach(self):
+        """
+        Drop the links to the neighbors and to the DAG leaf, which form reference cycles
+        with this trapezoid, so that it is freed as soon as it is no longer used
+        """
+        self.upper_left = self.lower_left = self.upper_right = self.lower_right = None
+        self._node = None
+
+
+class FrozenTrapezoid(BaseTrapezoid):
+    """
+    Trapezoid of a FrozenDAG. It has no neighbor links and no DAG leaf, so it
+    forms no reference cycles, and it knows its id in the FrozenDAG.
+    """
 
-    def setLeftNeighbors(self, neighbors, auto=False):
-        assert isinstance(neighbors, set) and all(isinstance(n, Trapezoid) for n in neighbors)
-
-        # there are no left neighbors
-        if not neighbors or self.top.p == self.bottom.p:
-            return
-
-        if self.is_zero_width:
-            """ zero-width trapezoid """
-            y_high = self.left_p.y
-            y_low = self.right_p.y
-        elif self.left_p == self.top.p:
-            l = self.bottom
-            y_high = self.left_p.y
-            y_low = l.slope * self.left_p.x + l.intercept
-        elif self.left_p == self.bottom.p:
-            l = self.top
-            y_high = l.slope * self.left_p.x + l.intercept
-            y_low = self.left_p.y
-        else:
-            l = self.bottom
-            y_low = l.slope * self.left_p.x + l.intercept
-            l = self.top
-            y_high = l.slope * self.left_p.x + l.intercept
-
-        for n in neighbors:
-            # if the neighbor already exists or its not directly adjacent to self, then skip
-            if n in self.left_neighbors or self.left_p.x != n.right_p.x:
-                continue
-            if n.is_zero_width:
-                """ zero-width trapezoid """
-                ny_high = n.left_p.y
-                ny_low = n.right_p.y
-            elif n.right_p == n.top.q:
-                l = n.bottom
-                ny_high = n.right_p.y
-                ny_low = l.slope * n.right_p.x + l.intercept
-            elif n.right_p == n.bottom.q:
-                l = n.top
-                ny_high = l.slope * n.right_p.x + l.intercept
-                ny_low = n.right_p.y
-            else:
-                l = n.bottom
-                ny_low = l.slope * n.right_p.x + l.intercept
-                l = n.top
-                ny_high = l.slope * n.right_p.x + l.intercept
-
-            # sides overlap
-            if ny_low < y_high < ny_high or ny_low < y_low < ny_high \
-                    or y_low < ny_low < y_high or y_low < ny_high < y_high \
-                    or (y_low == ny_low and y_high == ny_high):
-                self.left_neighbors.add(n)
-                if not auto:
-                    n.setRightNeighbors({self}, auto=True)
-
-    def setRightNeighbors(self, neighbors, auto=False):
-        assert isinstance(neighbors, set) and all(isinstance(n, Trapezoid) for n in neighbors)
-
-        # there are no right neighbors
-        if not neighbors or self.top.q == self.bottom.q:
-            return
-
-        if self.is_zero_width:
-            y_high = self.left_p.y
-            y_low = self.right_p.y
-        elif self.right_p == self.top.q:
-            l = self.bottom
-            y_high = self.right_p.y
-            y_low = l.slope * self.right_p.x + l.intercept
-        elif self.right_p == self.bottom.q:
-            l = self.top
-            y_high = l.slope * self.right_p.x + l.intercept
-            y_low = self.right_p.y
-        else:
-            l = self.bottom
-            y_low = l.slope * self.right_p.x + l.intercept
-            l = self.top
-            y_high = l.slope * self.right_p.x + l.intercept
-
-        for n in neighbors:
-            # if the neighbor already exists or its not directly adjacent to self, then skip
-            if n in self.right_neighbors or self.right_p.x != n.left_p.x:
-                continue
-            if n.is_zero_width:
-                """ zero-width trapezoid """
-                ny_high = n.left_p.y
-                ny_low = n.right_p.y
-            elif n.left_p == n.top.p:
-                l = n.bottom
-                ny_high = n.left_p.y
-                ny_low = l.slope * n.left_p.x + l.intercept
-            elif n.left_p == n.bottom.p:
-                l = n.top
-                ny_high = l.slope * n.left_p.x + l.intercept
-                ny_low = n.left_p.y
-            else:
-                l = n.bottom
-                ny_low = l.slope * n.left_p.x + l.intercept
-                l = n.top
-                ny_high = l.slope * n.left_p.x + l.intercept
-
-            # sides overlap
-            if ny_low < y_high < ny_high or ny_low < y_low < ny_high \
-                    or y_low < ny_low < y_high or y_low < ny_high < y_high \
-                    or (y_low == ny_low and y_high == ny_high):
-                self.right_neighbors.add(n)
-                if not auto:
-                    n.setLeftNeighbors({self})
-
-    def __hash__(self):
-        return super().__hash__()
-
-    def __eq__(self, other):
-        """Override the default Equals behavior"""
-        if isinstance(other, self.__class__):
-            return self.left_p == other.left_p and self.right_p == other.right_p \
-                   and self.top == other.top and self.bottom == other.bottom
-        return super().__eq__(other)
-
-    def __ne__(self, other):
-        """Define a non-equality test"""
-        if isinstance(other, self.__class__):
-            return not self == other
-        return NotImplemented
+    __slots__ = ('left_p', 'right_p', 'top', 'bottom', 'id')
 
-    def __repr__(self):
-        return '<Trapezoid left_p:%s right_p:%s top:%s bottom:%s>' % (str(self.left_p), str(self.right_p),
-                                                                      str(self.top), str(self.bottom))
+    # the neighbor links are not kept
+    upper_left = lower_left = upper_right = lower_right = None
+
+    def __init__(self, left_p, right_p, top, bottom, id):
+        super().__init__()
+        assert isinstance(left_p, Point) and isinstance(right_p, Point), 'left_p and/or right_p is not a point'
+        assert isinstance(top, LineSegment) and isinstance(bottom,
+                                                           LineSegment), 'top and/or bottom is not a line segment'
+        self.left_p = left_p
+        self.right_p = right_p
+        self.top = top
+        self.bottom = bottom
+        self.id = id
+
+
+def neighbors(upper, lower) -> tuple:
+    if upper is None:
+        return () if lower is None else (lower,)
+    if lower is None or lower is upper:
+        return upper,
+    return upper, lower
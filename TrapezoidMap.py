@@ -1,91 +1,151 @@
 from Polygon import Polygon
-from Trapezoid import Trapezoid
+from Trapezoid import Trapezoid, BaseTrapezoid
+from TrapezoidStore import TrapezoidStore
 from DAG import DAG
 # from llist import dllist
 import networkx as nx
+import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.figure import Figure
 from MatPlotAnnotater import MatPlotAnnotater
 
 
 class TrapezoidMap:
     """
-    Class representing a trapezoidal map with a set of trapezoids
+    Class representing a trapezoidal map with a set of trapezoids.
+    Pass a (empty) TrapezoidStore instead of a set to keep the trapezoids
+    in the columns of the array-backed store.
     """
 
     def __init__(self, trapezoids):
-        assert isinstance(trapezoids, set) and all(isinstance(n, Trapezoid) for n in trapezoids)
+        assert isinstance(trapezoids, (set, TrapezoidStore)) and all(isinstance(n, BaseTrapezoid) for n in trapezoids)
         self.trapezoids = trapezoids
         # self.trapezoids = dllist(trapezoids)
         self.G = None
+        # optional Instrumentation counting created and deleted trapezoids
+        self.instrumentation = None
+
+    @property
+    def uses_store(self) -> bool:
+        return isinstance(self.trapezoids, TrapezoidStore)
+
+    def newTrapezoid(self, left_p, right_p, top, bottom) -> Trapezoid:
+        """
+        Create a trapezoid for this map. It still has to be added with addTrapezoid.
+        :return: a Trapezoid, or a StoredTrapezoid if the map uses a TrapezoidStore
+        """
+        if self.instrumentation is not None:
+            self.instrumentation.trapezoids_created += 1
+        if self.uses_store:
+            return self.trapezoids.allocate(left_p, right_p, top, bottom)
+        return Trapezoid(left_p, right_p, top, bottom)
 
     def addTrapezoid(self, trapezoids: set):
-        assert isinstance(trapezoids, set) and all(isinstance(t, Trapezoid) for t in trapezoids)
+        assert isinstance(trapezoids, set) and all(isinstance(t, BaseTrapezoid) for t in trapezoids)
         self.trapezoids |= trapezoids
         # self.trapezoids.extendright(trapezoids)
 
     def deleteTrapezoidFromMap(self, trapezoids: set):
-        assert isinstance(trapezoids, set) and all(isinstance(t, Trapezoid) for t in trapezoids)
+        assert isinstance(trapezoids, set) and all(isinstance(t, BaseTrapezoid) for t in trapezoids)
         # self.trapezoids = [t for t in self.trapezoids if t not in trapezoids]
+        if self.instrumentation is not None:
+            # only count trapezoids that are still in the map
+            self.instrumentation.trapezoids_deleted += sum(t in self.trapezoids for t in trapezoids)
         for t in trapezoids:
-            self.trapezoids.discard(t)
+            # neighbors that still link to t lose the link
             for n in t.left_neighbors:
-                n.right_neighbors.discard(t)
+                n.replaceRightNeighbor(t, None, None)
             for n in t.right_neighbors:
-                n.left_neighbors.discard(t)
+                n.replaceLeftNeighbor(t, None, None)
+            # a store releases the row here, so unlink the neighbors first
+            self.trapezoids.discard(t)
 
-    def visualize(self, P=None):
+    def outlines(self) -> np.ndarray:
+        """
+        The corners of all trapezoids as one vertex array, computed with numpy
+        :return: array of shape (n, 4, 2) with the bottom left, top left, top right
+            and bottom right corner of every trapezoid
+        """
+        coordinates = np.array([(t.left_p.x, t.left_p.y, t.right_p.x, t.right_p.y,
+                                 t.top.p.x, t.top.p.y, t.top.q.x, t.top.q.y,
+                                 t.bottom.p.x, t.bottom.p.y, t.bottom.q.x, t.bottom.q.y)
+                                for t in self.trapezoids], dtype=np.float64).reshape(-1, 12)
+        left, right = coordinates[:, 0:2].T, coordinates[:, 2:4].T
+        top, bottom = coordinates[:, 4:8], coordinates[:, 8:12]
+        corners = np.empty((len(coordinates), 4, 2))
+        corners[:, :2, 0] = left[0][:, None]
+        corners[:, 2:, 0] = right[0][:, None]
+        corners[:, 0, 1] = y_at(bottom, *left)
+        corners[:, 1, 1] = y_at(top, *left)
+        corners[:, 2, 1] = y_at(top, *right)
+        corners[:, 3, 1] = y_at(bottom, *right)
+        return corners
+
+    def draw(self, ax, P=None, viewport=None, min_pixels=1.0) -> int:
+        """
+        Draw the trapezoids with a single LineCollection, and the polygon with a single PolyCollection
+        :param ax: matplotlib Axes
+        :param P: Polygon to fill, None to only draw the trapezoids
+        :param viewport: (xmin, ymin, xmax, ymax) to draw, None for the whole map
+        :param min_pixels: skip trapezoids whose width and height are both smaller than this many pixels
+        :return: number of trapezoids drawn
+        """
+        assert P is None or isinstance(P, Polygon)
+        corners = self.outlines()
+        if viewport is None:
+            viewport = (corners[:, :, 0].min(), corners[:, :, 1].min(), corners[:, :, 0].max(), corners[:, :, 1].max())
+        xmin, ymin, xmax, ymax = viewport
+        ax.set_xlim(xmin, xmax)
+        ax.set_ylim(ymin, ymax)
+
+        # clip to the viewport and skip the trapezoids that would cover less than a pixel
+        low, high = corners[:, :, 1].min(axis=1), corners[:, :, 1].max(axis=1)
+        left, right = corners[:, 0, 0], corners[:, 2, 0]
+        width = (right - left) * ax.bbox.width / (xmax - xmin)
+        height = (high - low) * ax.bbox.height / (ymax - ymin)
+        visible = (left <= xmax) & (right >= xmin) & (low <= ymax) & (high >= ymin) \
+            & ((width >= min_pixels) | (height >= min_pixels))
+        corners = corners[visible]
+
+        if P is not None:
+            holes = set(map(id, P.holes))
+            ax.add_collection(PolyCollection([[(p.x, p.y) for p in ring] for ring in P.rings],
+                                             facecolors=['w' if id(ring) in holes else 'b' for ring in P.rings],
+                                             edgecolors='none', zorder=1))
+        # closed outlines, the first corner is repeated
+        ax.add_collection(LineCollection(np.concatenate([corners, corners[:, :1]], axis=1),
+                                         colors='k', linewidths=0.5, zorder=2))
+        return len(corners)
+
+    def render(self, path, P=None, viewport=None, size=(8, 8), dpi=100, min_pixels=1.0) -> int:
+        """
+        Render the map to a file without a display, e.g. on a server. The format
+        follows from the extension of path, e.g. .png or .svg.
+        :param path: output file
+        :param P: Polygon to fill, None to only draw the trapezoids
+        :param viewport: (xmin, ymin, xmax, ymax) to draw, None for the whole map
+        :param size: figure size in inches
+        :param dpi: resolution
+        :param min_pixels: skip trapezoids whose width and height are both smaller than this many pixels
+        :return: number of trapezoids drawn
+        """
+        fig = Figure(figsize=size, dpi=dpi)
+        # the Agg canvas draws without pyplot, so no backend or window is needed
+        FigureCanvasAgg(fig)
+        drawn = self.draw(fig.add_subplot(1, 1, 1), P, viewport, min_pixels)
+        fig.savefig(path)
+        return drawn
+
+    def visualize(self, P=None, viewport=None):
         """
         Visualize the given trapezoidal map with matplotlib
         :param P: Polygon
+        :param viewport: (xmin, ymin, xmax, ymax) to show, None for the whole map
         :return:
         """
-        assert P is None or isinstance(P, Polygon)
-
-        # Draw the trapezoidal map
-        for trapezoid in self.trapezoids:
-            y_s = []
-            # now we need to project a vertical line on the bottom edge
-            if trapezoid.left_p == trapezoid.top.p:
-                l = trapezoid.bottom
-                y = l.slope * trapezoid.left_p.x + l.intercept
-                y_s.extend([y, trapezoid.left_p.y])
-            elif trapezoid.left_p == trapezoid.bottom.p:
-                l = trapezoid.top
-                y = l.slope * trapezoid.left_p.x + l.intercept
-                y_s.extend([trapezoid.left_p.y, y])
-            else:
-                l = trapezoid.bottom
-                y = l.slope * trapezoid.left_p.x + l.intercept
-                y_s.append(y)
-                l = trapezoid.top
-                y = l.slope * trapezoid.left_p.x + l.intercept
-                y_s.append(y)
-
-            if trapezoid.right_p == trapezoid.top.p:
-                l = trapezoid.bottom
-                y = l.slope * trapezoid.right_p.x + l.intercept
-                y_s.extend([trapezoid.right_p.y, y])
-            elif trapezoid.right_p == trapezoid.bottom.p:
-                l = trapezoid.top
-                y = l.slope * trapezoid.right_p.x + l.intercept
-                y_s.extend([y, trapezoid.right_p.y])
-            else:
-                l = trapezoid.top
-                y = l.slope * trapezoid.right_p.x + l.intercept
-                y_s.append(y)
-                l = trapezoid.bottom
-                y = l.slope * trapezoid.right_p.x + l.intercept
-                y_s.append(y)
-
-            y_s.append(y_s[0])
-            x_s = [trapezoid.left_p.x, trapezoid.left_p.x, trapezoid.right_p.x, trapezoid.right_p.x, trapezoid.left_p.x]
-            plt.plot(x_s, y_s, 'k')
-
-        # Draw the polygon also if there
-        if P:
-            x_s = [p.x for p in P.V]
-            y_s = [p.y for p in P.V]
-            plt.fill(x_s, y_s, 'b')
+        self.draw(plt.gca(), P, viewport)
 
         # Display
         plt.show()
@@ -93,12 +153,12 @@ class TrapezoidMap:
     def visualize_graph(self):
         assert isinstance(self.G, DAG)
         G = nx.DiGraph()
-        for n in self.G.in_order(self.G.root):
+        for n in self.G.nodes():
             if n.left_child:
                 G.add_edge(n, n.left_child)
             if n.right_child:
                 G.add_edge(n, n.right_child)
-        pos = self.hierarchy_pos(G, root=self.G.root, is_dag=nx.is_directed_acyclic_graph(G))
+        pos = self.hierarchy_pos(G, root=self.G.root)
         nx.draw(G, pos=pos)
         fig = plt.gcf()
 
@@ -112,35 +172,47 @@ class TrapezoidMap:
         plt.show()
         return G
 
-    def hierarchy_pos(self, G, root, is_dag, width=1., vert_gap=0.2, vert_loc=0, xcenter=0.5,
-                      pos=None, parent=None):
+    def hierarchy_pos(self, G, root, width=1., vert_gap=0.2, vert_loc=0, xcenter=0.5):
         """
-        If there is a cycle that is reachable from root, then this will see infinite recursion.
+        Tree layout of a DAG, breadth first from root. Every node is placed once, on the
+        level where it is first reached and inside the horizontal space of the parent that
+        reached it, so shared subtrees and cycles are not expanded again.
         G: the graph
-        root: the root node of current branch
-        width: horizontal space allocated for this branch - avoids overlap with other branches
+        root: the root node
+        width: horizontal space of the root - avoids overlap with other branches
         vert_gap: gap between levels of hierarchy
         vert_loc: vertical location of root
         xcenter: horizontal location of root
-        pos: a dict saying where all nodes go if they have been assigned
-        parent: parent of this branch.
+        :return: dict with the (x, y) position of every node reachable from root
         """
-        if pos is None:
-            pos = {root: (xcenter, vert_loc)}
-        else:
-            pos[root] = (xcenter, vert_loc)
-        neighbors = G.neighbors(root)
-        if (not is_dag) and parent is not None:
-            neighbors.remove(parent)
-        if len(neighbors) != 0:
-            dx = width / len(neighbors)
-            nextx = xcenter - width / 2 - dx / 2
-            for neighbor in neighbors:
-                nextx += dx
-                pos = self.hierarchy_pos(G, neighbor, is_dag=is_dag, width=dx, vert_gap=vert_gap,
-                                         vert_loc=vert_loc - vert_gap, xcenter=nextx,
-                                         pos=pos, parent=root)
+        pos = {root: (xcenter, vert_loc)}
+        level = [(root, width)]
+        while level:
+            next_level = []
+            for node, span in level:
+                children = [c for c in G.successors(node) if c not in pos]
+                if not children:
+                    continue
+                dx = span / len(children)
+                x, y = pos[node]
+                nextx = x - span / 2 - dx / 2
+                for child in children:
+                    nextx += dx
+                    pos[child] = (nextx, y - vert_gap)
+                    next_level.append((child, dx))
+            level = next_level
         return pos
 
     def __repr__(self):
         return '<Trapezoidal map -> Trapezoids: %s>' % (str(self.trapezoids))
+
+
+def y_at(segments, x, y) -> np.ndarray:
+    """
+    Heights of segments, given as rows (px, py, qx, qy), on the walls through the points (x, y).
+    In the symbolically sheared plane a vertical segment crosses the wall of a point at its height.
+    """
+    px, py, qx, qy = segments.T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        heights = py + (x - px) * ((qy - py) / (qx - px))
+    return np.where(qx == px, np.clip(y, py, qy), heights)
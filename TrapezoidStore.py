@@ -0,0 +1,466 @@
+from array import array
+from collections.abc import MutableSet
+from weakref import KeyedRef
+
+from Point import Point
+from LineSegment import LineSegment
+from Trapezoid import BaseTrapezoid
+from DAGNode import DAGNode
+
+
+class TrapezoidStore(MutableSet):
+    """
+    Structure-of-arrays storage for the trapezoids of a trapezoidal map.
+
+    Every trapezoid is a row in a set of preallocated, growable columns and
+    is addressed by an integer handle. The columns hold the left/right
+    x-coordinates, the ids of the left/right points and top/bottom segments
+    and the handles of the upper/lower left and right neighbors.
+
+    The only Python object per row is its DAG leaf, a StoredLeaf that refers
+    to the row by handle. The StoredTrapezoid views are created when they are
+    asked for and are freed as soon as they are no longer used; while a view
+    is in use, asking for the same row returns the same view.
+
+    The store behaves like the set of live trapezoids of the map, so it can
+    be used as `TrapezoidMap.trapezoids` directly.
+
+    The store is not a way to save memory: the DAG nodes, which take most of
+    the memory of a construction, remain Python objects, and every field is
+    read through a property. Measured after building with tracemalloc, and
+    as the best of three untraced builds, against the default set of Trapezoids:
+
+        gen_3200      2.89 MB  0.32 s  ->  2.75 MB  0.73 s
+        nongen_6400   5.86 MB  0.45 s  ->  5.49 MB  1.82 s
+
+    i.e. about 5% less memory for a build that is 2 to 4 times slower. What it
+    offers is the flat columns, see columns().
+    """
+
+    NO_NEIGHBOR = -1
+
+    # row states
+    FREE = 0
+    PENDING = 1
+    LIVE = 2
+
+    def __init__(self, capacity=64):
+        assert isinstance(capacity, int) and capacity > 0
+        self.capacity = 0
+        self.size = 0
+        self.n_live = 0
+        self.free = []
+
+        # geometry columns
+        self.left_x = array('d')
+        self.right_x = array('d')
+        self.left_p = array('i')
+        self.right_p = array('i')
+        self.top = array('i')
+        self.bottom = array('i')
+
+        # neighbor columns, one slot per neighbor
+        self.upper_left = array('i')
+        self.lower_left = array('i')
+        self.upper_right = array('i')
+        self.lower_right = array('i')
+
+        # search path length to the leaf of every row, -1 if not known
+        self.depth = array('i')
+
+        # row state, the DAG leaves and weak references to the views in use
+        self.state = bytearray()
+        self.nodes = []
+        self.views = {}
+
+        # interned points and segments
+        self.points = []
+        self.point_ids = {}
+        self.segments = []
+        self.segment_ids = {}
+
+        self.grow(capacity)
+
+    def grow(self, capacity):
+        """
+        Grow every column to hold at least the given number of rows
+        :param capacity:
+        :return:
+        """
+        extra = capacity - self.capacity
+        if extra <= 0:
+            return
+        for column in (self.left_x, self.right_x):
+            column.extend(array('d', bytes(8 * extra)))
+        for column in (self.left_p, self.right_p, self.top, self.bottom):
+            column.extend(array('i', bytes(4 * extra)))
+        for column in (*self.neighbor_columns(), self.depth):
+            column.extend(array('i', [self.NO_NEIGHBOR]) * extra)
+        self.state.extend(bytes(extra))
+        self.nodes.extend([None] * extra)
+        self.capacity = capacity
+
+    def neighbor_columns(self) -> tuple:
+        return self.upper_left, self.lower_left, self.upper_right, self.lower_right
+
+    def point_id(self, point) -> int:
+        pid = self.point_ids.get(point)
+        if pid is None:
+            pid = self.point_ids[point] = len(self.points)
+            self.points.append(point)
+        return pid
+
+    def segment_id(self, segment) -> int:
+        sid = self.segment_ids.get(segment)
+        if sid is None:
+            sid = self.segment_ids[segment] = len(self.segments)
+            self.segments.append(segment)
+        return sid
+
+    def allocate(self, left_p, right_p, top, bottom):
+        """
+        Allocate a new row for a trapezoid. The row is not part of the map
+        until it is added to the store.
+        :return: the StoredTrapezoid view on the new row
+        """
+        assert isinstance(left_p, Point) and isinstance(right_p, Point), 'left_p and/or right_p is not a point'
+        assert isinstance(top, LineSegment) and isinstance(bottom, LineSegment), \
+            'top and/or bottom is not a line segment'
+        if self.free:
+            handle = self.free.pop()
+        else:
+            if self.size == self.capacity:
+                self.grow(2 * self.capacity or 64)
+            handle = self.size
+            self.size += 1
+
+        self.left_x[handle] = left_p.x
+        self.right_x[handle] = right_p.x
+        self.left_p[handle] = self.point_id(left_p)
+        self.right_p[handle] = self.point_id(right_p)
+        self.top[handle] = self.segment_id(top)
+        self.bottom[handle] = self.segment_id(bottom)
+        self.state[handle] = self.PENDING
+        self.nodes[handle] = StoredLeaf(self, handle)
+        return self.view(handle)
+
+    def view(self, handle):
+        """
+        The StoredTrapezoid view on a row, the view that is in use if there is one
+        :param handle:
+        :return:
+        """
+        ref = self.views.get(handle)
+        if ref is not None:
+            view = ref()
+            if view is not None:
+                return view
+        view = StoredTrapezoid(self, handle)
+        self.views[handle] = KeyedRef(view, self.forget, handle)
+        return view
+
+    def forget(self, ref):
+        """
+        Drop the reference to a view that is no longer used
+        :param ref: KeyedRef to the view, keyed by its handle
+        :return:
+        """
+        if self.views.get(ref.key) is ref:
+            del self.views[ref.key]
+
+    def release(self, handle):
+        """
+        Return a row to the free list and detach its view if it is in use
+        :param handle:
+        :return:
+        """
+        if self.state[handle] == self.LIVE:
+            self.n_live -= 1
+        self.state[handle] = self.FREE
+        ref = self.views.pop(handle, None)
+        view = ref() if ref is not None else None
+        if view is not None:
+            # whoever still uses the view can read the trapezoid it was
+            view.fields = view.left_p, view.right_p, view.top, view.bottom
+            view.handle = self.NO_NEIGHBOR
+        leaf = self.nodes[handle]
+        if leaf is not None and leaf.store is self:
+            # the leaf was not replaced by a search structure
+            leaf.detach()
+        self.nodes[handle] = None
+        for column in (*self.neighbor_columns(), self.depth):
+            column[handle] = self.NO_NEIGHBOR
+        self.free.append(handle)
+
+    def live_handles(self):
+        """
+        Handles of all trapezoids currently in the map, in row order
+        :return:
+        """
+        state = self.state
+        return [h for h in range(self.size) if state[h] == self.LIVE]
+
+    def columns(self):
+        """
+        Zero-copy NumPy views on the geometry columns. Rows that are not live
+        contain stale data; mask them with the 'live' column.
+        :return: dict of column name to numpy array
+        """
+        import numpy as np
+        n = self.size
+        return {
+            'left_x': np.frombuffer(self.left_x, dtype=np.float64, count=n),
+            'right_x': np.frombuffer(self.right_x, dtype=np.float64, count=n),
+            'top': np.frombuffer(self.top, dtype=np.int32, count=n),
+            'bottom': np.frombuffer(self.bottom, dtype=np.int32, count=n),
+            'upper_left': np.frombuffer(self.upper_left, dtype=np.int32, count=n),
+            'lower_left': np.frombuffer(self.lower_left, dtype=np.int32, count=n),
+            'upper_right': np.frombuffer(self.upper_right, dtype=np.int32, count=n),
+            'lower_right': np.frombuffer(self.lower_right, dtype=np.int32, count=n),
+            'live': np.frombuffer(bytes(self.state[:n]), dtype=np.uint8) == self.LIVE,
+        }
+
+    def nbytes(self) -> int:
+        """
+        Size in bytes of the array columns (excluding interned objects)
+        :return:
+        """
+        columns = (self.left_x, self.right_x, self.left_p, self.right_p, self.top, self.bottom,
+                   *self.neighbor_columns(), self.depth)
+        return sum(c.itemsize * len(c) for c in columns) + len(self.state)
+
+    # MutableSet interface over the live trapezoids
+
+    def __contains__(self, trapezoid):
+        return isinstance(trapezoid, StoredTrapezoid) and trapezoid.store is self \
+               and trapezoid.handle >= 0 and self.state[trapezoid.handle] == self.LIVE
+
+    def __iter__(self):
+        view = self.view
+        return iter([view(h) for h in self.live_handles()])
+
+    def __len__(self):
+        return self.n_live
+
+    def add(self, trapezoid):
+        assert isinstance(trapezoid, StoredTrapezoid) and trapezoid.store is self, \
+            'trapezoid was not allocated in this store'
+        assert trapezoid.handle >= 0, 'trapezoid has already been released'
+        if self.state[trapezoid.handle] != self.LIVE:
+            self.state[trapezoid.handle] = self.LIVE
+            self.n_live += 1
+
+    def discard(self, trapezoid):
+        if isinstance(trapezoid, StoredTrapezoid) and trapezoid.store is self and trapezoid.handle >= 0:
+            self.release(trapezoid.handle)
+
+    def clear(self):
+        """
+        Release every row at once and empty the columns, the leaves and the views
+        that are still referenced elsewhere are detached like released trapezoids
+        """
+        for leaf in self.nodes:
+            if leaf is not None and leaf.store is self:
+                leaf.detach()
+        for ref in self.views.values():
+            view = ref()
+            if view is not None:
+                view.handle = self.NO_NEIGHBOR
+        for column in (self.left_x, self.right_x, self.left_p, self.right_p, self.top, self.bottom,
+                       *self.neighbor_columns(), self.depth, self.state, self.nodes, self.free,
+                       self.points, self.segments):
+            del column[:]
+        self.views.clear()
+        self.point_ids.clear()
+        self.segment_ids.clear()
+        self.capacity = self.size = self.n_live = 0
+
+    def __repr__(self):
+        return '<TrapezoidStore rows:%d live:%d capacity:%d>' % (self.size, self.n_live, self.capacity)
+
+
+RELEASED = 'the row of the trapezoid has been released'
+
+
+def neighbor_slot(name):
+    """
+    Property for a neighbor slot of a stored trapezoid, which holds the handle of the neighbor
+    """
+    def get(self):
+        if self.handle < 0:
+            # the trapezoid has been released
+            return None
+        n = getattr(self.store, name)[self.handle]
+        return None if n == TrapezoidStore.NO_NEIGHBOR else self.store.view(n)
+
+    def set(self, trapezoid):
+        if self.handle < 0:
+            raise ValueError(RELEASED)
+        assert trapezoid is None or isinstance(trapezoid, StoredTrapezoid) and trapezoid.store is self.store
+        getattr(self.store, name)[self.handle] = TrapezoidStore.NO_NEIGHBOR if trapezoid is None else trapezoid.handle
+
+    return property(get, set)
+
+
+class StoredTrapezoid(BaseTrapezoid):
+    """
+    Trapezoid whose fields live in a row of a TrapezoidStore. It exposes the
+    same attributes as a regular Trapezoid, so the construction algorithms
+    work on it unchanged. It derives from the slot-less BaseTrapezoid, so a
+    view holds nothing but the store and the handle of its row.
+
+    Once the row has been released the neighbor slots are None and the DAG
+    leaf can not be read. A view that was in use when its row was released
+    keeps its geometry, like a removed Trapezoid, other released views raise
+    ValueError for every field.
+    """
+
+    __slots__ = ('store', 'handle', 'fields', '__weakref__')
+
+    def __init__(self, store, handle):
+        # the row was filled in by the store
+        self.store = store
+        self.handle = handle
+        # the geometry after the row has been released
+        self.fields = None
+
+    def released_fields(self) -> tuple:
+        """
+        The geometry of a view whose row has been released
+        :return: left_p, right_p, top, bottom
+        """
+        if self.fields is None:
+            raise ValueError(RELEASED)
+        return self.fields
+
+    @property
+    def left_p(self):
+        if self.handle < 0:
+            return self.released_fields()[0]
+        return self.store.points[self.store.left_p[self.handle]]
+
+    @property
+    def right_p(self):
+        if self.handle < 0:
+            return self.released_fields()[1]
+        return self.store.points[self.store.right_p[self.handle]]
+
+    @property
+    def top(self):
+        if self.handle < 0:
+            return self.released_fields()[2]
+        return self.store.segments[self.store.top[self.handle]]
+
+    @property
+    def bottom(self):
+        if self.handle < 0:
+            return self.released_fields()[3]
+        return self.store.segments[self.store.bottom[self.handle]]
+
+    upper_left = neighbor_slot('upper_left')
+    lower_left = neighbor_slot('lower_left')
+    upper_right = neighbor_slot('upper_right')
+    lower_right = neighbor_slot('lower_right')
+
+    @property
+    def node(self):
+        if self.handle < 0:
+            raise ValueError(RELEASED)
+        return self.store.nodes[self.handle]
+
+    @node.setter
+    def node(self, node):
+        if self.handle < 0:
+            raise ValueError(RELEASED)
+        self.store.nodes[self.handle].modify(node)
+
+    def adopt(self, leaf):
+        """
+        Make the DAG leaf of a row that leaves the map the leaf of this new row,
+        whose own leaf is not part of the DAG yet
+        """
+        if self.handle < 0:
+            raise ValueError(RELEASED)
+        assert isinstance(leaf, StoredLeaf) and leaf.store is self.store and leaf.left_child is None
+        nodes = self.store.nodes
+        nodes[node_object.__get__(leaf)] = None
+        node_object.__set__(leaf, self.handle)
+        nodes[self.handle] = leaf
+
+    @property
+    def is_zero_width(self):
+        if self.handle < 0:
+            left_p, right_p = self.released_fields()[:2]
+            return left_p.x == right_p.x
+        return self.store.left_x[self.handle] == self.store.right_x[self.handle]
+
+    def detach(self):
+        # the links are columns of the store, which TrapezoidStore.clear drops
+        pass
+
+    def __repr__(self):
+        if self.handle < 0 and self.fields is None:
+            return '<Trapezoid released>'
+        return super().__repr__()
+
+
+class StoredLeaf(DAGNode):
+    """
+    DAG leaf of a row of a TrapezoidStore. The leaf keeps the handle of the row
+    in the slot of its graph object and creates the view on the row when the
+    graph object is asked for, so a row needs no other Python object. A leaf
+    that is modified into an inner node drops the store and holds its graph
+    object like any DAGNode.
+    """
+
+    __slots__ = ('store',)
+
+    def __init__(self, store, handle):
+        # the graph object is the row, so do not initialize DAGNode
+        self.store = store
+        node_object.__set__(self, handle)
+        self.left_child = None
+        self.right_child = None
+
+    @property
+    def graph_object(self):
+        store = self.store
+        if store is None:
+            return node_object.__get__(self)
+        return store.view(node_object.__get__(self))
+
+    @graph_object.setter
+    def graph_object(self, graph_object):
+        self.store = None
+        node_object.__set__(self, graph_object)
+
+    def detach(self):
+        # the row is gone, so the leaf no longer leads to a trapezoid
+        self.graph_object = None
+
+
+# the slot of DAGNode that the graph_object property of StoredLeaf hides
+node_object = DAGNode.__dict__['graph_object']
+
+
+class DepthColumn:
+    """
+    The search path lengths of the trapezoids of a TrapezoidStore, with the
+    dictionary methods that RandomizedIncrementalConstruction uses
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def get(self, trapezoid, default=None):
+        depth = self.store.depth[trapezoid.handle]
+        return default if depth < 0 else depth
+
+    def pop(self, trapezoid, default=None):
+        depth = self.get(trapezoid, default)
+        self.store.depth[trapezoid.handle] = TrapezoidStore.NO_NEIGHBOR
+        return depth
+
+    def __setitem__(self, trapezoid, depth):
+        assert isinstance(depth, int) and depth >= 0
+        self.store.depth[trapezoid.handle] = depth
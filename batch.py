@@ -0,0 +1,145 @@
+"""
+Batch decomposition of many polygon files with a process pool.
+
+The input is a directory (every *.txt and *.bin file in it) or a manifest
+file with one polygon path per line. The files are split into chunks and
+decomposed by a pool of worker processes. Every worker loads the polygon,
+builds the decomposition and, if an output directory is given, saves the
+built search structure (see FrozenDAG.save). One JSON line with the status
+and timings is written per file, so one malformed polygon only fails its
+own entry.
+
+    python batch.py INPUT [--engine ric|sweep] [--workers N] [--chunksize N] [--output-dir DIR]
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from main import load_input
+from Engines import ENGINES, Timeout, build, time_limit
+
+EXTENSIONS = ('.txt', '.bin')
+
+
+def list_inputs(path):
+    """
+    Polygon files of a directory, or the paths listed in a manifest file
+    :param path:
+    :return: list of file names
+    """
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(EXTENSIONS))
+    base = os.path.dirname(path)
+    with open(path) as manifest:
+        lines = [line.strip() for line in manifest]
+    # relative paths in a manifest are relative to the manifest itself
+    return [os.path.join(base, line) for line in lines if line and not line.startswith('#')]
+
+
+def decompose_file(file_name, engine='ric', seed=0, output_dir=None, timeout=0):
+    """
+    Load, decompose and optionally save a single polygon file. Errors are
+    reported in the result instead of raised.
+    :return: dict with the status and timings for the file
+    """
+    result = {'file': file_name, 'engine': engine, 'status': 'ok'}
+    try:
+        with time_limit(timeout):
+            start = time.perf_counter()
+            polygon = load_input(file_name)
+            result['vertices'] = len(polygon.V)
+            result['load_s'] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            structure = build(engine, polygon, seed)
+            result['build_s'] = time.perf_counter() - start
+            result['trapezoids'] = len(structure.getTrapezoidalMap().trapezoids)
+
+            if output_dir is not None and hasattr(structure, 'save'):
+                start = time.perf_counter()
+                output = os.path.join(output_dir, os.path.splitext(os.path.basename(file_name))[0] + '.vdag')
+                structure.save(output)
+                result['output'] = output
+                result['write_s'] = time.perf_counter() - start
+    except Timeout:
+        result['status'] = 'timeout'
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = '%s: %s' % (type(e).__name__, e)
+    return result
+
+
+def decompose_chunk(file_names, engine, seed, output_dir, timeout):
+    return [decompose_file(file_name, engine, seed, output_dir, timeout) for file_name in file_names]
+
+
+def decompose_files(file_names, engine='ric', workers=None, chunksize=1, seed=0, output_dir=None, timeout=0):
+    """
+    Decompose many polygon files in a process pool
+    :param file_names: polygon files
+    :param engine: 'ric' or 'sweep'
+    :param workers: number of worker processes (default: number of CPUs)
+    :param chunksize: number of files handed to a worker at once
+    :param seed: random seed for every build
+    :param output_dir: directory for the saved structures, None to only report
+    :param timeout: seconds per file before it is abandoned, 0 for no limit
+    :return: generator of per-file result dicts, in completion order
+    """
+    assert engine in ENGINES, 'unknown engine %s' % engine
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    chunks = [file_names[i:i + chunksize] for i in range(0, len(file_names), chunksize)]
+
+    crashed = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(decompose_chunk, chunk, engine, seed, output_dir, timeout): chunk
+                   for chunk in chunks}
+        for future in as_completed(futures):
+            try:
+                yield from future.result()
+            except BrokenProcessPool:
+                crashed.extend(futures[future])
+
+    # a worker died (e.g. killed for running out of memory), which breaks the
+    # whole pool: retry every unfinished file in a pool of its own to find the culprit
+    for file_name in crashed:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            try:
+                yield executor.submit(decompose_file, file_name, engine, seed, output_dir, timeout).result()
+            except BrokenProcessPool:
+                yield {'file': file_name, 'engine': engine, 'status': 'crashed'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help='directory of polygon files or a manifest with one path per line')
+    parser.add_argument('--engine', default='ric', choices=sorted(ENGINES))
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--chunksize', type=int, default=1, help='files per task')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=int, default=0, help='seconds per file, 0 for no limit')
+    parser.add_argument('--output-dir', default=None, help='write the built structures here')
+    parser.add_argument('--summary', default='-', help='JSON lines summary file (default: stdout)')
+    args = parser.parse_args()
+
+    file_names = list_inputs(args.input)
+    counts = {}
+    start = time.perf_counter()
+    with (open(args.summary, 'w') if args.summary != '-' else contextlib.nullcontext(sys.stdout)) as summary:
+        for result in decompose_files(file_names, args.engine, args.workers, args.chunksize, args.seed,
+                                      args.output_dir, args.timeout):
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+            summary.write(json.dumps(result) + '\n')
+            summary.flush()
+    print('%d files in %.2fs: %s' % (len(file_names), time.perf_counter() - start,
+                                     ', '.join('%d %s' % (n, status) for status, n in sorted(counts.items()))),
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
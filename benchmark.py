@@ -0,0 +1,192 @@
+"""
+Benchmark runner for the decomposition engines over the bundled Data/ corpus.
+
+For every input file and engine the build is repeated with fixed seeds.
+Every run records the build time, the peak traced memory of the build, the
+number of trapezoids, the size and depth of the search structure and the
+batch query throughput. The search structure is the DAG of the randomized
+construction and the persistent slab tree of the sweep; its depth is the
+number of comparisons on the longest search path. Runs that fail or exceed the timeout are recorded
+with their status. The results and percentile summaries are written as JSON.
+
+The builds do not check the input. Whether every input is a simple polygon
+is checked once per file and reported next to its runs, unless --no-validate
+is given.
+
+    python benchmark.py [files...] [--engines ric,sweep] [--repeats 5] [--no-validate] [--output results.json]
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import re
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from PolygonIO import load_polygon
+from Engines import ENGINES, Timeout, build, time_limit
+
+LADDER = re.compile(r'^(gen|nongen)_(\d+)\.txt$')
+CHALLENGES = ['bigchallengepolygon_6aE15.txt', 'Germany_Datachallenge.txt']
+METRICS = ['build_s', 'peak_bytes', 'trapezoids', 'search_nodes', 'search_depth', 'queries_per_s']
+
+
+def default_files(data_dir='Data'):
+    """
+    The gen_* and nongen_* size ladders ordered by size, then the challenge inputs
+    """
+    ladder = []
+    for name in os.listdir(data_dir):
+        match = LADDER.match(name)
+        if match:
+            ladder.append((match.group(1), int(match.group(2)), name))
+    files = [os.path.join(data_dir, name) for _, _, name in sorted(ladder)]
+    return files + [os.path.join(data_dir, name) for name in CHALLENGES]
+
+
+def percentiles(values):
+    """
+    Nearest-rank percentile summary of a list of numbers
+    """
+    if not values:
+        return None
+    values = sorted(values)
+
+    def rank(p):
+        return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+    return {'n': len(values), 'min': values[0], 'p50': rank(50), 'p90': rank(90), 'p99': rank(99),
+            'max': values[-1], 'mean': sum(values) / len(values)}
+
+
+def run_once(engine, file_name, seed, args):
+    """
+    Build and measure one seeded run
+    :param engine: name of the engine
+    :return: dict with the status and the metrics of the run
+    """
+    result = {'seed': seed, 'status': 'ok'}
+    try:
+        polygon = load_polygon(file_name, validate=False)
+        with time_limit(args.timeout):
+            start = time.perf_counter()
+            structure = build(engine, polygon, seed)
+            result['build_s'] = time.perf_counter() - start
+    except Timeout:
+        result['status'] = 'timeout'
+        return result
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = '%s: %s' % (type(e).__name__, e)
+        return result
+
+    result['trapezoids'] = len(structure.getTrapezoidalMap().trapezoids)
+
+    if engine == 'ric':
+        frozen = structure.getFrozenDAG()
+        result['search_nodes'] = len(frozen)
+        result['search_depth'] = frozen.depth()
+    else:
+        index = structure.getSlabIndex()
+        result['search_nodes'] = index.size
+        result['search_depth'] = index.query_depth()
+
+    # uniform query points in the bounding box of the polygon
+    rng = np.random.default_rng(seed)
+    xs = np.array([p.x for p in polygon.V])
+    ys = np.array([p.y for p in polygon.V])
+    qx = rng.uniform(xs.min(), xs.max(), args.queries)
+    qy = rng.uniform(ys.min(), ys.max(), args.queries)
+    start = time.perf_counter()
+    structure.locate_many(qx, qy)
+    result['queries_per_s'] = args.queries / (time.perf_counter() - start)
+
+    if args.memory:
+        # a second build of the same seed, the tracing slows it down
+        polygon = load_polygon(file_name, validate=False)
+        tracemalloc.start()
+        try:
+            with time_limit(args.timeout * 4):
+                build(engine, polygon, seed)
+            result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        except Timeout:
+            pass
+        finally:
+            tracemalloc.stop()
+
+    return result
+
+
+def validate(polygon):
+    """
+    Check whether an input is a simple polygon, separately from the builds
+    :return: dict with the result, the time it took and the first pair of edges that crosses
+    """
+    start = time.perf_counter()
+    crossing = polygon.find_crossing()
+    return {'simple': crossing is None, 'validate_s': time.perf_counter() - start,
+            'crossing': None if crossing is None else [str(edge) for edge in crossing]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*', help='input files (default: the Data/ ladders and challenges)')
+    parser.add_argument('--engines', default='ric,sweep', help='comma separated: %s' % ','.join(ENGINES))
+    parser.add_argument('--repeats', type=int, default=5, help='seeded runs per file and engine')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first run')
+    parser.add_argument('--timeout', type=int, default=60, help='seconds before a build is abandoned')
+    parser.add_argument('--queries', type=int, default=100000, help='query points per run')
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help='skip the peak memory build')
+    parser.add_argument('--no-validate', dest='validate', action='store_false',
+                        help='do not check whether the inputs are simple polygons')
+    parser.add_argument('--output', default='-', help='JSON output file (default: stdout)')
+    args = parser.parse_args()
+
+    engines = args.engines.split(',')
+    for name in engines:
+        if name not in ENGINES:
+            parser.error('unknown engine %s' % name)
+    files = args.files or default_files()
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeats': args.repeats,
+            'seed': args.seed,
+            'timeout': args.timeout,
+            'queries': args.queries,
+        },
+        'results': [],
+    }
+    for file_name in files:
+        polygon = load_polygon(file_name, validate=False)
+        vertices = len(polygon.V)
+        validation = validate(polygon) if args.validate else None
+        for name in engines:
+            runs = [run_once(name, file_name, args.seed + r, args) for r in range(args.repeats)]
+            ok = [run for run in runs if run['status'] == 'ok']
+            summary = {metric: percentiles([run[metric] for run in ok if metric in run]) for metric in METRICS}
+            report['results'].append({'file': file_name, 'vertices': vertices, 'validation': validation,
+                                      'engine': name, 'ok': len(ok), 'runs': runs, 'summary': summary})
+            build_s = summary['build_s']
+            print('%-40s %-10s %6d vertices  %d/%d ok  build p50 %s%s' % (
+                file_name, name, vertices, len(ok), len(runs),
+                '%.3fs' % build_s['p50'] if build_s else '-',
+                '  (not simple)' if validation and not validation['simple'] else ''), file=sys.stderr)
+
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Micro-benchmark for the hashing scheme of the geometry kernel.
+
+Compares the legacy scheme, which hashed str(self) for points, segments,
+trapezoids and DAG nodes, with the current coordinate/identity hashing. It
+times the raw set operations the construction performs and full builds of
+RandomizedIncrementalConstruction on the gen_* datasets.
+
+    python benchmark_hashing.py [files...] [--seeds N] [--timeout SECONDS]
+"""
+import argparse
+import contextlib
+import time
+
+from main import load_input
+from Point import Point
+from LineSegment import LineSegment
+from Trapezoid import Trapezoid
+from DAGNode import DAGNode
+from RandomizedIncrementalConstruction import RandomizedIncrementalConstruction
+from Engines import Timeout, time_limit
+
+DEFAULT_FILES = ['Data/gen_10.txt', 'Data/gen_20.txt', 'Data/gen_50.txt', 'Data/gen_100.txt']
+
+
+def legacy_hash(self):
+    return hash(str(self))
+
+
+@contextlib.contextmanager
+def legacy_hashing():
+    """
+    Temporarily restore the str(self) based hashing
+    """
+    classes = (Point, LineSegment, Trapezoid, DAGNode)
+    saved = [cls.__dict__.get('__hash__') for cls in classes]
+    for cls in classes:
+        cls.__hash__ = legacy_hash
+    try:
+        yield
+    finally:
+        for cls, h in zip(classes, saved):
+            if h is None:
+                del cls.__hash__
+            else:
+                cls.__hash__ = h
+
+
+def time_set_operations(polygon, repeat=20) -> float:
+    """
+    Insert, test and discard every point, segment and a trapezoid per segment
+    :return: seconds
+    """
+    segments = polygon.E
+    trapezoids = [Trapezoid(s.p, s.q, s, s) for s in segments]
+    objects = polygon.V + segments + trapezoids + [t.node for t in trapezoids]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        s = set()
+        for o in objects:
+            s.add(o)
+        for o in objects:
+            assert o in s
+        for o in objects:
+            s.discard(o)
+    return time.perf_counter() - start
+
+
+def time_build(file_name, seed, timeout) -> float:
+    """
+    Time one build, or return None if it did not finish within the timeout
+    """
+    polygon = load_input(file_name)
+    try:
+        with time_limit(timeout):
+            start = time.perf_counter()
+            RandomizedIncrementalConstruction(polygon, seed=seed)
+            return time.perf_counter() - start
+    except Timeout:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*', default=DEFAULT_FILES)
+    parser.add_argument('--seeds', type=int, default=5, help='number of seeded builds per file')
+    parser.add_argument('--timeout', type=int, default=5, help='seconds before a build is skipped')
+    args = parser.parse_args()
+
+    print('%-22s %12s %12s %8s' % ('set operations', 'legacy (ms)', 'current (ms)', 'speedup'))
+    for file_name in args.files:
+        polygon = load_input(file_name)
+        with legacy_hashing():
+            legacy = time_set_operations(polygon)
+        current = time_set_operations(polygon)
+        print('%-22s %12.2f %12.2f %7.1fx' % (file_name, legacy * 1000, current * 1000, legacy / current))
+
+    print()
+    print('%-22s %12s %12s %8s %8s' % ('build', 'legacy (ms)', 'current (ms)', 'speedup', 'builds'))
+    for file_name in args.files:
+        legacy, current = 0.0, 0.0
+        builds = 0
+        for seed in range(args.seeds):
+            with legacy_hashing():
+                t_legacy = time_build(file_name, seed, args.timeout)
+            t_current = time_build(file_name, seed, args.timeout)
+            # only compare seeds for which both builds finished
+            if t_legacy is not None and t_current is not None:
+                legacy += t_legacy
+                current += t_current
+                builds += 1
+        if builds:
+            print('%-22s %12.2f %12.2f %7.1fx %8d' % (file_name, legacy / builds * 1000, current / builds * 1000,
+                                                      legacy / current, builds))
+        else:
+            print('%-22s %12s %12s %8s %8d' % (file_name, '-', '-', '-', 0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""
+Equivalence checks of the decompositions on small inputs of the Data/ corpus.
+
+- delete: deleting segments from a randomized construction gives the same
+  map as building it from the remaining segments, and inserting them again
+  gives the map of the whole polygon, with both trapezoid stores.
+- sweep: the line sweep builds the same trapezoids and neighbor links as the
+  randomized construction, and both locate every query point in the same
+  trapezoid.
+- crossing: the Shamos-Hoey sweep finds a crossing exactly when a check of
+  every pair of edges does, and the pair it returns does cross.
+
+The delete and sweep checks only run on simple polygons. A check prints one
+line per file, and the script exits with status 1 if any check fails or raises.
+
+    python checks.py [files...] [--checks delete,sweep,crossing]
+"""
+import argparse
+import glob
+import itertools
+import os
+import random
+import sys
+
+from PolygonIO import load_polygon
+from RandomizedIncrementalConstruction import RandomizedIncrementalConstruction
+from LineSweep import LineSweep
+from ShamosHoey import find_crossing, touches
+
+SLOTS = ('upper_left', 'lower_left', 'upper_right', 'lower_right')
+
+
+def default_files(data_dir='Data'):
+    """
+    The test_* inputs, gen_100 and the non-simple nongen_100
+    """
+    files = sorted(glob.glob(os.path.join(data_dir, 'test_*.txt')))
+    return files + [os.path.join(data_dir, name) for name in ('gen_100.txt', 'nongen_100.txt')]
+
+
+def key(t) -> tuple:
+    """
+    A trapezoid by its geometry, which is the same in every engine and store
+    """
+    return t.left_p, t.right_p, t.top, t.bottom
+
+
+def trapezoid_map(structure) -> dict:
+    """
+    The trapezoids of a construction with the keys of their neighbors
+    :return: dict of trapezoid key to the neighbor keys, in the order of SLOTS
+    """
+    return {key(t): tuple(None if getattr(t, slot) is None else key(getattr(t, slot)) for slot in SLOTS)
+            for t in structure.getTrapezoidalMap().trapezoids}
+
+
+def map_difference(a, b) -> str:
+    """
+    Describe how two results of trapezoid_map differ, empty if they are equal
+    """
+    if a == b:
+        return ''
+    only_a, only_b = a.keys() - b.keys(), b.keys() - a.keys()
+    links = sum(a[k] != b[k] for k in a.keys() & b.keys())
+    return '%d trapezoids only in the first map, %d only in the second, %d with other neighbors' % (
+        len(only_a), len(only_b), links)
+
+
+def query_points(polygon, n, seed):
+    """
+    Random points in the bounding box, points on the vertical lines through the vertices, and the vertices
+    """
+    rng = random.Random(seed)
+    xs = [p.x for p in polygon.V]
+    ys = [p.y for p in polygon.V]
+    points = [(rng.uniform(min(xs), max(xs)), rng.uniform(min(ys), max(ys))) for _ in range(n)]
+    points += [(v.x, rng.uniform(min(ys), max(ys))) for v in rng.choices(polygon.V, k=n)]
+    return points + [(v.x, v.y) for v in polygon.V]
+
+
+def check_delete(file_name, seed=0) -> list:
+    """
+    Delete half of the segments one by one and compare with a build without them, then
+    insert them again and compare with the original build
+    :return: list of failures
+    """
+    failures = []
+    for store in ('set', 'array'):
+        polygon = load_polygon(file_name, validate=False)
+        ric = RandomizedIncrementalConstruction(polygon, store=store, seed=seed)
+        whole = trapezoid_map(ric)
+        deleted = random.Random(seed).sample(polygon.E, len(polygon.E) // 2)
+        for segment in deleted:
+            ric.delete_segment(segment)
+        # delete_segment took the segments out of the polygon as well
+        rebuilt = RandomizedIncrementalConstruction(polygon, store=store, seed=seed + 1)
+        difference = map_difference(trapezoid_map(ric), trapezoid_map(rebuilt))
+        if difference:
+            failures.append('%s store, after deleting %d segments: %s' % (store, len(deleted), difference))
+        ric.insert_segments(deleted)
+        difference = map_difference(trapezoid_map(ric), whole)
+        if difference:
+            failures.append('%s store, after inserting them again: %s' % (store, difference))
+        fresh = RandomizedIncrementalConstruction(polygon, store=store, seed=seed + 2)
+        points = query_points(polygon, 500, seed)
+        located = sum(key(ric.locate(x, y)) != key(fresh.locate(x, y)) for x, y in points)
+        if located:
+            failures.append('%s store, %d of %d points located in other trapezoids than in a new build' % (
+                store, located, len(points)))
+    return failures
+
+
+def check_sweep(file_name, seed=0) -> list:
+    """
+    Compare the line sweep with the randomized construction
+    :return: list of failures
+    """
+    failures = []
+    polygon = load_polygon(file_name, validate=False)
+    ric = RandomizedIncrementalConstruction(polygon, seed=seed)
+    sweep = LineSweep(polygon)
+    difference = map_difference(trapezoid_map(ric), trapezoid_map(sweep))
+    if difference:
+        failures.append(difference)
+    points = query_points(polygon, 2000, seed)
+    located = sum(key(ric.locate(x, y)) != key(sweep.locate(x, y)) for x, y in points)
+    if located:
+        failures.append('%d of %d points located in different trapezoids' % (located, len(points)))
+    index = sweep.getSlabIndex()
+    ids = sweep.locate_many([x for x, _ in points], [y for _, y in points]).tolist()
+    located = sum(index.trapezoids[i] is not sweep.locate(x, y) for i, (x, y) in zip(ids, points))
+    if located:
+        failures.append('%d of %d points located differently by locate_many' % (located, len(points)))
+    return failures
+
+
+def check_crossing(file_name) -> list:
+    """
+    Compare the Shamos-Hoey sweep with a check of every pair of edges
+    :return: list of failures
+    """
+    polygon = load_polygon(file_name, validate=False)
+    crossing = find_crossing(polygon.E)
+    pairwise = any(touches(s, t) for s, t in itertools.combinations(polygon.E, 2))
+    if (crossing is not None) != pairwise:
+        return ['the sweep %s a crossing, the pairwise check %s' % (
+            'finds' if crossing is not None else 'does not find', 'does' if pairwise else 'does not')]
+    if crossing is not None and not touches(*crossing):
+        return ['the sweep returns %s and %s, which do not cross' % crossing]
+    return []
+
+
+CHECKS = {
+    'delete': check_delete,
+    'sweep': check_sweep,
+    'crossing': check_crossing,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*', help='input files (default: Data/test_*, gen_100 and nongen_100)')
+    parser.add_argument('--checks', default=','.join(CHECKS), help='comma separated: %s' % ','.join(CHECKS))
+    args = parser.parse_args()
+
+    checks = args.checks.split(',')
+    for name in checks:
+        if name not in CHECKS:
+            parser.error('unknown check %s' % name)
+
+    failed = 0
+    for file_name in args.files or default_files():
+        simple = find_crossing(load_polygon(file_name, validate=False).E) is None
+        for name in checks:
+            if name != 'crossing' and not simple:
+                print('%-8s %-28s skipped, not a simple polygon' % (name, file_name))
+                continue
+            try:
+                failures = CHECKS[name](file_name)
+            except Exception as e:
+                failures = ['%s: %s' % (type(e).__name__, e)]
+            print('%-8s %-28s %s' % (name, file_name, 'ok' if not failures else 'FAILED'))
+            for failure in failures:
+                print('    %s' % failure)
+            failed += bool(failures)
+
+    if failed:
+        print('%d checks failed' % failed)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
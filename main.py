@@ -1,31 +1,19 @@
-from Polygon import Polygon, Point
+from PolygonIO import load_polygon
 from RandomizedIncrementalConstruction import RandomizedIncrementalConstruction
 import time
-import gc
 from LineSweep import LineSweep
 
 
 def load_input(file_name):
     """
     Loads input, parses input and returns graph data structure
-    :param file_name:
+    :param file_name: text or binary vertex file, see PolygonIO
     :return:
     """
-    with open(file_name, 'r') as file:
-        n = int(file.readline())
-        V = []
-
-        # Create a polygon
-        for i in range(n):
-            line = file.readline()
-            line = [int(l) for l in line.split()]
-            # We add 1 to every value such that we can always make a bounding
-            # box around the coordinates s.t. the bounding box does not intersect
-            # with for example a point (0, 0)
-            V.append(Point(line[0] + 1, line[1] + 1))
-        P = Polygon(V)
-
-        return P
+    # We add 1 to every value (more if there are negative coordinates) such
+    # that we can always make a bounding box around the coordinates s.t. the
+    # bounding box does not intersect with for example a point (0, 0)
+    return load_polygon(file_name)
 
 
 if __name__ == '__main__':
@@ -42,10 +30,10 @@ if __name__ == '__main__':
         print((end-start)*1000)
         times.append((end-start)*1000)
 
-        # Garbage collection
+        # Release the construction, compaction breaks its reference cycles so no garbage collection is needed
         if i != 0:
+            R.compact()
             R = None
-            gc.collect()
 
     # Visualize the map
     T = R.getTrapezoidalMap()